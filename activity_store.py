@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+import metrics
+from startup import profile as startup_profile
+from user_registry import UserRegistry
+
+logger = logging.getLogger(__name__)
+
+
+flush_latency = metrics.Histogram(
+    'bot_users_flush_seconds', "Activity store flush duration",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+def _epoch(iso_string):
+    try:
+        return datetime.fromisoformat(iso_string).timestamp()
+    except (TypeError, ValueError):
+        return 0
+
+
+def _iso(epoch):
+    # نفس صيغة datetime.now().isoformat() اللي بالتخزين
+    return datetime.fromtimestamp(epoch).isoformat()
+
+
+class ActivityStore:
+    """In-memory last-seen registry with write-behind persistence.
+
+    `users` is a UserRegistry (epoch seconds); the backend keeps ISO
+    strings. touch() only updates memory; the storage backend is written by a
+    background task once `flush_interval` seconds pass or `flush_threshold`
+    touches pile up, and once more on shutdown.
+
+    With `lazy`, the registry starts empty and start() reads the backend in
+    a worker thread, so updates are answered while it loads; wait_loaded()
+    gates whatever needs every user (broadcasts, /active).
+    """
+
+    def __init__(self, backend, flush_interval=30.0, flush_threshold=1000, lazy=False):
+        self.backend = backend
+        self.users = UserRegistry()
+        self.loaded = False
+        self.load_seconds = None
+        self._load_task = None
+        # حذف قبل ما يكمل التحميل، ينطبق على النسخة المحملة
+        self._discarded_early = set()
+        if not lazy:
+            self._finish_load(*self._read_users())
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+
+        self.dirty = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.flush_seconds_total = 0.0
+        self.last_flush_seconds = 0.0
+        self.bytes_written = 0
+
+        self._changed = {}
+        self._wakeup = None
+        self._task = None
+        self._refreshed_at = datetime.now()
+
+    def _read_users(self):
+        # الـ parse يصير مرة وحدة هنا، مو بكل /active
+        started = time.perf_counter()
+        registry = UserRegistry(
+            (user_id, _epoch(seen)) for user_id, seen in self.backend.iter_users()
+        )
+        return registry, time.perf_counter() - started
+
+    def _finish_load(self, registry, elapsed):
+        self.users.update_from(registry)
+        for user_id in self._discarded_early:
+            self.users.pop(user_id)
+        self._discarded_early = set()
+        self.loaded = True
+        self.load_seconds = elapsed
+
+    async def _load(self):
+        try:
+            self._finish_load(*await asyncio.to_thread(self._read_users))
+        except Exception:
+            logger.exception("Failed to load users")
+            raise
+        startup_profile.record('users_loaded', self.load_seconds)
+        logger.info("Loaded %d users in %.2fs", len(self.users), self.load_seconds)
+
+    async def wait_loaded(self):
+        if not self.loaded and self._load_task is not None:
+            await asyncio.shield(self._load_task)
+
+    def touch(self, user_id, when=None):
+        when = when or datetime.now()
+        epoch = int(when.timestamp())
+        self.users.set(user_id, epoch)
+        self._changed[user_id] = epoch
+        self.dirty += 1
+        if self._wakeup is not None and self.dirty >= self.flush_threshold:
+            self._wakeup.set()
+
+    def discard(self, user_id):
+        # None بالتغييرات معناها حذف المستخدم من التخزين
+        if not self.loaded:
+            self._discarded_early.add(user_id)
+        if self.users.pop(user_id) is not None or not self.loaded:
+            self._changed[user_id] = None
+            self.dirty += 1
+
+    def active_count(self, hours):
+        return self.users.count_since(hours)
+
+    async def refresh(self):
+        """Merges in users that other processes sharing the backend flushed.
+
+        Used when the bot runs as several workers (see ingress.py): each
+        one only touches its own users. Another worker may flush up to
+        `flush_interval` late, so every refresh re-reads that much before
+        the previous one. Returns how many users were added or moved.
+        """
+        await self.wait_loaded()
+        started = datetime.now()
+        since = self._refreshed_at - timedelta(seconds=2 * self.flush_interval + 5)
+        rows = await asyncio.to_thread(self.backend.load_users_since, since.isoformat())
+        self._refreshed_at = started
+        merged = 0
+        for user_id, seen in rows.items():
+            # الأحدث يفوز، وتغييراتنا اللي ما انكتبت بعد أحدث من اللي بالقاعدة
+            epoch = int(_epoch(seen))
+            if epoch > self.users.get(user_id, -1):
+                self.users.set(user_id, epoch)
+                merged += 1
+        return merged
+
+    def _snapshot(self):
+        changed, self._changed = self._changed, {}
+        users = self.users.snapshot() if self.backend.full_rewrite else None
+        return self.dirty, changed, users
+
+    def _write(self, changed, users):
+        # التحويل لنصوص ISO يصير هنا، بـ thread الكتابة مع flush_async
+        started = time.perf_counter()
+        changed = {k: None if v is None else _iso(v) for k, v in changed.items()}
+        if users is not None:
+            ids, seen = users
+            users = {user_id: _iso(epoch) for user_id, epoch in zip(ids, seen)}
+        written = self.backend.save_users(changed, users)
+        return written, time.perf_counter() - started
+
+    def _record(self, pending, written, elapsed):
+        # ما نصفّر العداد كلياً: touch() ممكن تصير أثناء الكتابة
+        self.dirty = max(0, self.dirty - pending)
+        flush_latency.observe(elapsed)
+        self.flush_count += 1
+        self.flush_seconds_total += elapsed
+        self.last_flush_seconds = elapsed
+        self.bytes_written += written
+        return written
+
+    def _failed(self, changed):
+        self.flush_errors += 1
+        logger.exception("Failed to flush user activity")
+        # نرجع التغييرات للطابور بدون ما نغطي على الأحدث منها
+        changed.update(self._changed)
+        self._changed = changed
+
+    def _can_flush(self):
+        # قبل التحميل، إعادة كتابة الملف كامل تمسح المستخدمين اللي ما انقروا بعد
+        return self.dirty and (self.loaded or not self.backend.full_rewrite)
+
+    def flush(self):
+        if not self._can_flush():
+            return 0
+        pending, changed, users = self._snapshot()
+        try:
+            written, elapsed = self._write(changed, users)
+        except Exception:
+            self._failed(changed)
+            return 0
+        return self._record(pending, written, elapsed)
+
+    async def flush_async(self):
+        # النسخة تنأخذ على الـ event loop، والكتابة بـ thread منفصل
+        if not self._can_flush():
+            return 0
+        pending, changed, users = self._snapshot()
+        try:
+            written, elapsed = await asyncio.to_thread(self._write, changed, users)
+        except Exception:
+            self._failed(changed)
+            return 0
+        return self._record(pending, written, elapsed)
+
+    async def _run(self):
+        while True:
+            # asyncio.wait وليس wait_for: الأخير ممكن يبلع الـ cancel إذا تزامن مع الحدث
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=self.flush_interval)
+            finally:
+                waiter.cancel()
+            self._wakeup.clear()
+            await self.flush_async()
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if not self.loaded and self._load_task is None:
+            self._load_task = loop.create_task(self._load())
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._load_task is not None and not self._load_task.done():
+            # بدون التحميل كامل، flush الأخير ممكن يمسح مستخدمين من users.json
+            await asyncio.wait({self._load_task})
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+        self.flush()
+
+    def stats(self):
+        return {
+            'dirty': self.dirty,
+            'flush_count': self.flush_count,
+            'flush_errors': self.flush_errors,
+            'flush_seconds_total': self.flush_seconds_total,
+            'last_flush_seconds': self.last_flush_seconds,
+            'bytes_written': self.bytes_written,
+        }
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# حد تيليجرام 4096 حرف للرسالة، نترك هامش
+MAX_MESSAGE_CHARS = 4000
+# إعادة محاولة الرسائل المحولة اللي فشل إرسالها: تتضاعف لحد الأقصى
+RETRY_MAX_DELAY = 300.0
+
+events_total = metrics.Counter(
+    'bot_admin_events_total', "Events queued for the admin", ['kind']
+)
+messages_total = metrics.Counter(
+    'bot_admin_messages_total', "Messages actually sent to the admin", ['kind']
+)
+
+
+def _chunks(parts, separator):
+    # يجمع الأجزاء برسائل ما تتجاوز MAX_MESSAGE_CHARS؛ مع كل رسالة عدد الأجزاء اللي بيها
+    chunk = ''
+    count = 0
+    for part in parts:
+        part = part[:MAX_MESSAGE_CHARS]
+        if chunk and len(chunk) + len(separator) + len(part) > MAX_MESSAGE_CHARS:
+            yield chunk, count
+            chunk = ''
+            count = 0
+        chunk = f"{chunk}{separator}{part}" if chunk else part
+        count += 1
+    if chunk:
+        yield chunk, count
+
+
+class AdminNotifier:
+    """Batches admin notifications instead of one DM per event.
+
+    Muted-user attempts are counted per user and sent as one digest every
+    `window` seconds. Forwarded user messages are urgent: they go out
+    `urgent_delay` seconds after the first one arrives, with everything
+    that came in meanwhile in the same message and repeats collapsed.
+    The user was already told their message was sent, so forwards that
+    fail go back on the queue and are retried with backoff; the digest
+    is best effort.
+    """
+
+    def __init__(self, bot, admin_chat_id, window=300.0, urgent_delay=2.0):
+        self.bot = bot
+        self.admin_chat_id = admin_chat_id
+        self.window = window
+        self.urgent_delay = urgent_delay
+        self._attempts = {}
+        self._forwards = {}
+        self._urgent = asyncio.Event()
+        self._window_started = time.monotonic()
+        self._retry_delay = 0.0
+        self._task = None
+
+    def muted_attempt(self, user):
+        events_total.inc('muted_attempt')
+        entry = self._attempts.get(user.id)
+        if entry is None:
+            self._attempts[user.id] = [user.username, 1]
+        else:
+            entry[1] += 1
+
+    def forward(self, user, text):
+        events_total.inc('forward')
+        key = (user.id, text)
+        entry = self._forwards.get(key)
+        if entry is None:
+            self._forwards[key] = [user.username, 1]
+        else:
+            entry[1] += 1
+        self._urgent.set()
+
+    @staticmethod
+    def _forward_text(user_id, text, username, count):
+        repeat = f" (×{count})" if count > 1 else ''
+        return f"رسالة من @{username or f'ID {user_id}'} (ID: {user_id}){repeat}:\n\n{text}"
+
+    def _digest_parts(self):
+        attempts, self._attempts = self._attempts, {}
+        if not attempts:
+            return []
+        minutes = max(1, round((time.monotonic() - self._window_started) / 60))
+        header = f"⚠️ محاولات مستخدمين مكتومين (آخر {minutes} د):"
+        lines = [
+            f"• @{username or 'N/A'} (ID: {user_id}): {count} مرة"
+            for user_id, (username, count) in sorted(attempts.items(), key=lambda kv: -kv[1][1])
+        ]
+        return [header] + lines
+
+    async def _send(self, kind, parts, separator):
+        """Sends `parts` in as few messages as fit; returns the indexes of parts that failed."""
+        failed = []
+        start = 0
+        for chunk, count in _chunks(parts, separator):
+            try:
+                await self.bot.send_message(chat_id=self.admin_chat_id, text=chunk)
+                messages_total.inc(kind)
+            except Exception as e:
+                logger.error("Failed to notify admin (%s): %s", kind, e)
+                failed.extend(range(start, start + count))
+            start += count
+        return failed
+
+    async def flush_forwards(self):
+        self._urgent.clear()
+        forwards, self._forwards = list(self._forwards.items()), {}
+        parts = [self._forward_text(user_id, text, *entry) for (user_id, text), entry in forwards]
+        failed = await self._send('forward', parts, '\n\n—\n\n')
+        if not failed:
+            self._retry_delay = 0.0
+            return
+        # الفاشلة ترجع أول الطابور، وأي رسائل وصلت بنفس الوقت تنضم وراها
+        retry = dict(forwards[index] for index in failed)
+        for key, (username, count) in self._forwards.items():
+            entry = retry.get(key)
+            if entry is None:
+                retry[key] = [username, count]
+            else:
+                entry[1] += count
+        self._forwards = retry
+        self._retry_delay = min(RETRY_MAX_DELAY, max(self.urgent_delay, self._retry_delay * 2))
+        logger.warning("Retrying %s admin forwards in %.0fs", len(failed), self._retry_delay)
+        self._urgent.set()
+
+    async def flush_digest(self):
+        parts = self._digest_parts()
+        self._window_started = time.monotonic()
+        await self._send('digest', parts, '\n')
+
+    async def _run(self):
+        while True:
+            timeout = self._window_started + self.window - time.monotonic()
+            # asyncio.wait وليس wait_for: الأخير ممكن يبلع الـ cancel إذا تزامن مع الحدث
+            waiter = asyncio.ensure_future(self._urgent.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=max(0.0, timeout))
+            finally:
+                waiter.cancel()
+            if self._urgent.is_set():
+                # ننتظر شوية حتى تتجمع الرسائل اللي توصل ورا بعض، أو أكثر بعد فشل
+                await asyncio.sleep(max(self.urgent_delay, self._retry_delay))
+                await self.flush_forwards()
+            # نفحص النافذة كل دورة: مع رسائل تتوالى بلا توقف الحدث يبقى
+            # مرفوع دائماً، والملخص ما كان يطلع أبداً
+            if time.monotonic() >= self._window_started + self.window:
+                await self.flush_digest()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_forwards()
+        if self._forwards:
+            logger.error("Dropped %s admin forwards on shutdown", len(self._forwards))
+        await self.flush_digest()
@@ -0,0 +1,106 @@
+"""Throughput of ingress.py as the number of worker processes grows.
+
+For each worker count, starts the fake Bot API and ingress.py (which
+starts the workers), posts --updates /start updates from --users users
+through the ingress and measures updates/sec and reply latency. Scaling
+needs as many free cores as workers plus one for the ingress.
+
+    python benchmarks/cluster_bench.py --workers 1,2,4 --updates 4000
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from fake_bot_api import FakeBotAPI, make_message_update
+from webhook_bench import REPO, SECRET, free_port, percentile
+
+
+def start_ingress(api, port, workers, workdir):
+    env = dict(
+        os.environ,
+        BOT_TOKEN='123456:bench',
+        BOT_API_BASE_URL=api.base_url,
+        WEBHOOK_URL=f"http://127.0.0.1:{port}",
+        WEBHOOK_SECRET=SECRET,
+        PORT=str(port),
+        INGRESS_WORKERS=str(workers),
+        INGRESS_WORKER_PORT=str(free_port()),
+        LOG_LEVEL='WARNING',
+        PYTHONPATH=REPO,
+    )
+    return subprocess.Popen(
+        [sys.executable, os.path.join(REPO, 'ingress.py')],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def measure(args, workers):
+    api = await FakeBotAPI(latency=args.api_latency).start()
+    proc = start_ingress(api, free_port(), workers, tempfile.mkdtemp(prefix='bot-cluster-'))
+    try:
+        await asyncio.wait_for(api.webhook_ready.wait(), timeout=90)
+        url = api.webhook['url']
+        latencies = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+        user_locks = {}
+
+        async with aiohttp.ClientSession(headers={'X-Telegram-Bot-Api-Secret-Token': SECRET}) as session:
+            async def one(i):
+                user_id = 1000 + i % args.users
+                lock = user_locks.setdefault(user_id, asyncio.Lock())
+                async with lock, semaphore:
+                    reply = api.wait_for_message(user_id)
+                    started = time.perf_counter()
+                    update = make_message_update(api.next_update_id(), user_id, '/start')
+                    async with session.post(url, json=update) as resp:
+                        resp.release()
+                    replied_at, _, _ = await asyncio.wait_for(reply, timeout=60)
+                    latencies.append(replied_at - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.updates)))
+            elapsed = time.perf_counter() - started
+        return {
+            'workers': workers,
+            'throughput': args.updates / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=90)
+        await api.stop()
+
+
+async def run(args):
+    results = []
+    for workers in args.workers:
+        results.append(await measure(args, workers))
+    base = results[0]['throughput'] / results[0]['workers']
+    print(f"cores available: {os.cpu_count()}")
+    print(f"{'workers':>7} {'updates/s':>10} {'speedup':>8} {'efficiency':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for result in results:
+        speedup = result['throughput'] / results[0]['throughput']
+        efficiency = result['throughput'] / (base * result['workers'])
+        print(f"{result['workers']:>7} {result['throughput']:>10.1f} {speedup:>8.2f} "
+              f"{efficiency:>10.0%} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=lambda s: [int(n) for n in s.split(',')], default=[1, 2, 4])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--api-latency', type=float, default=0.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Local stand-in for the Telegram Bot API, for benchmarks.
+
+Point the bot at it with BOT_API_BASE_URL=http://127.0.0.1:<port>. It answers
+the methods the bot uses, records every call, serves getUpdates from a queue
+and lets a driver await the next outgoing message for a chat.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+
+# الطرق اللي ترجع Message
+MESSAGE_METHODS = {
+    'sendMessage', 'editMessageText', 'sendPhoto', 'sendDocument',
+    'sendVideo', 'sendAudio', 'sendAnimation', 'sendVoice',
+}
+
+
+def _decode(value):
+    # PTB يرسل القيم غير النصية مرمّزة JSON
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def make_user(user_id):
+    return {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"}
+
+
+def make_message_update(update_id, user_id, text):
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': make_user(user_id),
+        'text': text,
+    }
+    if text.startswith('/'):
+        command = text.split()[0]
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    return {'update_id': update_id, 'message': message}
+
+
+class FakeBotAPI:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = []
+        self.counts = defaultdict(int)
+        self.updates = asyncio.Queue()
+        self.webhook = None
+        self.webhook_ready = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._waiters = defaultdict(list)
+        self._runner = None
+        self.port = None
+
+    def next_update_id(self):
+        return next(self._update_ids)
+
+    def _message(self, params):
+        chat_id = params.get('chat_id')
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text') or params.get('caption') or '',
+        }
+
+    def wait_for_message(self, chat_id, match=None):
+        # match(method, params) اختياري: نتجاهل الرسائل اللي ما تطابقه (مثلاً البث)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id].append((future, match))
+        return future
+
+    def _resolve(self, method, params):
+        waiters = self._waiters.pop(params.get('chat_id'), None)
+        if not waiters:
+            return
+        left = []
+        for future, match in waiters:
+            if future.done():
+                continue
+            if match is None or match(method, params):
+                future.set_result((time.perf_counter(), method, params))
+            else:
+                left.append((future, match))
+        if left:
+            self._waiters[params.get('chat_id')] = left
+
+    async def _get_updates(self, params):
+        timeout = float(params.get('timeout') or 0)
+        batch = []
+        try:
+            batch.append(await asyncio.wait_for(self.updates.get(), timeout=max(timeout, 0.01)))
+        except asyncio.TimeoutError:
+            return []
+        limit = int(params.get('limit') or 100)
+        while len(batch) < limit and not self.updates.empty():
+            batch.append(self.updates.get_nowait())
+        return batch
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = {k: _decode(v) for k, v in (await request.post()).items()
+                      if isinstance(v, str)}
+        self.counts[method] += 1
+        self.calls.append((time.perf_counter(), method, params))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == 'getMe':
+            result = BOT_USER
+        elif method == 'getUpdates':
+            result = await self._get_updates(params)
+        elif method == 'setWebhook':
+            self.webhook = params
+            self.webhook_ready.set()
+            result = True
+        elif method in MESSAGE_METHODS:
+            result = self._message(params)
+            self._resolve(method, params)
+        elif method == 'copyMessage':
+            result = {'message_id': next(self._message_ids)}
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self, port=0):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
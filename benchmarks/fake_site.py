@@ -0,0 +1,96 @@
+"""Local stand-in website for exercising traffic_simulator.py.
+
+Serves any GET path with a configurable delay, body size and error rate,
+and counts requests per path.
+
+    python benchmarks/fake_site.py --port 8080 --latency 0.01
+    python benchmarks/fake_site.py --port 8080 --processes 4
+    python traffic_simulator.py --base-url http://127.0.0.1:8080 load --rps 200 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import random
+from collections import Counter
+
+from aiohttp import web
+
+
+class FakeSite:
+    def __init__(self, latency=0.0, jitter=0.0, body_size=2048, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.body = b'x' * body_size
+        self.error_rate = error_rate
+        self.counts = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._runner = None
+        self.port = None
+
+    async def handle(self, request):
+        self.counts[request.path] += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            delay = self.latency + random.uniform(0, self.jitter)
+            if delay:
+                await asyncio.sleep(delay)
+            if random.random() < self.error_rate:
+                return web.Response(status=500, text='error')
+            return web.Response(body=self.body, content_type='text/html')
+        finally:
+            self.in_flight -= 1
+
+    async def start(self, port=0, reuse_port=False):
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', port, reuse_port=reuse_port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+async def serve(args):
+    site = FakeSite(args.latency, args.jitter, args.body_size, args.error_rate)
+    await site.start(args.port, reuse_port=args.processes > 1)
+    print(f"serving on {site.base_url} (pid {os.getpid()})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await site.stop()
+        print(dict(site.counts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--body-size', type=int, default=2048)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--processes', type=int, default=1,
+                        help="serve from this many processes sharing the port (SO_REUSEPORT)")
+    args = parser.parse_args()
+    # حتى ما يصير الموقع الوهمي هو عنق الزجاجة بقياس عدة عمليات تحميل
+    for _ in range(args.processes - 1):
+        if os.fork() == 0:
+            break
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Count Bot API calls and wall time per user flow.
+
+Runs main.py in webhook mode against the fake Bot API and walks each flow
+as a fresh user, one step at a time, waiting for the bot to go quiet
+before the next step.
+
+    python benchmarks/flow_calls.py
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+
+import aiohttp
+
+from fake_bot_api import FakeBotAPI, make_message_update
+from webhook_bench import SECRET, free_port, start_bot
+
+FLOWS = {
+    'start': ['/start'],
+    'theoretical': ['/start', 'حساب غياب النظري', '3'],
+    'practical': ['/start', 'حساب غياب العملي', '1.5'],
+    'blok': ['/start', 'حساب درجتك بلبلوك', '40', '100', '80'],
+    # نفس الحسابات برسالة وحدة
+    'theoretical_batch': ['/start', 'حساب غياب النظري', '3, 2, 1.5, 4'],
+    'blok_batch': ['/start', 'حساب درجتك بلبلوك', '40 100 80\n30 50 25'],
+    'contact': ['/start', 'ارسل رسالة لصاحب البوت', 'مرحبا'],
+}
+
+
+async def wait_quiet(api, quiet):
+    # نعتبر البوت خلص إذا ما صار أي طلب لمدة quiet ثانية
+    while True:
+        seen = len(api.calls)
+        await asyncio.sleep(quiet)
+        if len(api.calls) == seen:
+            return
+
+
+async def walk(api, session, url, user_id, steps, quiet):
+    # الوقت = من إرسال كل خطوة لحد آخر طلب سواه البوت بيها، مجموع كل الخطوات
+    first_call = len(api.calls)
+    busy = 0.0
+    for text in steps:
+        reply = api.wait_for_message(user_id)
+        update = make_message_update(api.next_update_id(), user_id, text)
+        posted = time.perf_counter()
+        async with session.post(url, json=update) as resp:
+            resp.release()
+        await asyncio.wait_for(reply, timeout=30)
+        await wait_quiet(api, quiet)
+        busy += api.calls[-1][0] - posted
+    calls = [method for _, method, _ in api.calls[first_call:]]
+    return calls, busy
+
+
+async def run(args):
+    api = await FakeBotAPI(latency=args.api_latency).start()
+    # تحويل رسالة التواصل للمشرف يتأخر ADMIN_URGENT_DELAY؛ نخليه أقل من
+    # --quiet حتى ينحسب ضمن خطوته وما تخلص الخطوة قبله
+    proc = start_bot(api, free_port(), tempfile.mkdtemp(prefix='bot-flows-'),
+                     extra_env={'ADMIN_URGENT_DELAY': str(args.quiet / 5)})
+    try:
+        await asyncio.wait_for(api.webhook_ready.wait(), timeout=30)
+        url = api.webhook['url']
+        async with aiohttp.ClientSession(headers={'X-Telegram-Bot-Api-Secret-Token': SECRET}) as session:
+            print(f"{'flow':<18} {'steps':>5} {'api calls':>9} {'calls/step':>10} {'bot time':>10}")
+            for user_id, (name, steps) in enumerate(FLOWS.items(), start=5000):
+                calls, elapsed = await walk(api, session, url, user_id, steps, args.quiet)
+                print(f"{name:<18} {len(steps):>5} {len(calls):>9} "
+                      f"{len(calls) / len(steps):>10.2f} {elapsed * 1000:>7.0f} ms")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--api-latency', type=float, default=0.05,
+                        help="simulated Bot API round-trip in seconds")
+    parser.add_argument('--quiet', type=float, default=0.5,
+                        help="seconds without API calls that end a step")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
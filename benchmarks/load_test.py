@@ -0,0 +1,300 @@
+"""Exam-day load test: many simulated students walking the real flows.
+
+Starts the fake Bot API and main.py (polling by default, or webhook), then
+lets --users students arrive at --arrival-rate per second. Each one walks
+one flow (weighted by --mix), waiting for the bot's reply and a short think
+time between steps. Midway the admin runs /new and broadcasts to everyone
+seen so far. Reports throughput, step latency percentiles per flow, Bot API
+calls per flow and the bot's memory growth.
+
+    python benchmarks/load_test.py --users 2000 --arrival-rate 100
+    python benchmarks/load_test.py --json result.json --max-p99-ms 500
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import aiohttp
+
+from fake_bot_api import FakeBotAPI, make_message_update
+from flow_calls import FLOWS
+from webhook_bench import SECRET, free_port, percentile, start_bot
+
+ADMIN_ID = 6177929931
+BROADCAST_TEXT = 'load-test broadcast'
+BROADCAST_FLOW = ['/new', BROADCAST_TEXT, 'نعم']
+DEFAULT_MIX = 'start=1,theoretical=3,practical=3,blok=2,contact=1'
+
+
+def rss_kb(pid):
+    # Linux فقط؛ بغيره نرجع None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def parse_mix(spec):
+    mix = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, weight = item.partition('=')
+        if name not in FLOWS:
+            raise SystemExit(f"unknown flow {name!r}; choose from {', '.join(FLOWS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Driver:
+    """Feeds updates to the bot and times each step until its reply."""
+
+    def __init__(self, api, mode, session=None, url=None):
+        self.api = api
+        self.mode = mode
+        self.session = session
+        self.url = url
+        self.latencies = defaultdict(list)
+        self.steps = 0
+        self.timeouts = 0
+
+    async def send(self, user_id, text):
+        update = make_message_update(self.api.next_update_id(), user_id, text)
+        if self.mode == 'webhook':
+            async with self.session.post(self.url, json=update) as resp:
+                resp.release()
+        else:
+            self.api.updates.put_nowait(update)
+
+    async def step(self, flow, user_id, text, match=None, timeout=60):
+        reply = self.api.wait_for_message(user_id, match)
+        sent = time.perf_counter()
+        await self.send(user_id, text)
+        try:
+            replied_at, _, params = await asyncio.wait_for(reply, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+        self.steps += 1
+        self.latencies[flow].append(replied_at - sent)
+        return params
+
+
+def not_broadcast(method, params):
+    return params.get('text') != BROADCAST_TEXT
+
+
+async def student(driver, user_id, flow, think):
+    for text in FLOWS[flow]:
+        if await driver.step(flow, user_id, text, not_broadcast) is None:
+            return
+        await asyncio.sleep(random.uniform(0, 2 * think))
+
+
+async def admin(driver, api, delay, timeout):
+    await asyncio.sleep(delay)
+    for text in BROADCAST_FLOW:
+        if await driver.step('broadcast', ADMIN_ID, text) is None:
+            return None
+    started = time.perf_counter()
+    deadline = started + timeout
+    # رسائل التقدم تجي كـ editMessageText؛ ننتظر ملخص النهاية
+    while time.perf_counter() < deadline:
+        try:
+            _, _, params = await asyncio.wait_for(
+                api.wait_for_message(ADMIN_ID), deadline - time.perf_counter())
+        except asyncio.TimeoutError:
+            break
+        if (params.get('text') or '').startswith('✔'):
+            return time.perf_counter() - started
+    return None
+
+
+async def sample_memory(pid, samples, interval=0.5):
+    while True:
+        value = rss_kb(pid)
+        if value is not None:
+            samples.append(value)
+        await asyncio.sleep(interval)
+
+
+def calls_per_flow(api, flows_by_user):
+    # كل طالب يمشي flow واحد، فكل طلب بـ chat_id تبعه ينحسب على الـ flow
+    per_flow = defaultdict(int)
+    broadcast_deliveries = 0
+    for _, method, params in api.calls:
+        chat_id = params.get('chat_id')
+        if chat_id == ADMIN_ID:
+            per_flow['broadcast'] += 1
+        elif params.get('text') == BROADCAST_TEXT:
+            broadcast_deliveries += 1
+        elif chat_id in flows_by_user:
+            per_flow[flows_by_user[chat_id]] += 1
+    return per_flow, broadcast_deliveries
+
+
+async def run(args):
+    mix = parse_mix(args.mix)
+    random.seed(args.seed)
+    api = await FakeBotAPI(latency=args.api_latency).start()
+    env = {
+        'BOT_MODE': args.mode,
+        'BROADCAST_RATE': str(args.broadcast_rate),
+        'LOG_LEVEL': 'WARNING',
+    }
+    proc = start_bot(api, free_port(), tempfile.mkdtemp(prefix='bot-load-'), env)
+    memory = []
+    try:
+        started = time.perf_counter()
+        if args.mode == 'webhook':
+            await asyncio.wait_for(api.webhook_ready.wait(), timeout=30)
+        else:
+            while not api.counts['getUpdates']:
+                if time.perf_counter() - started > 30 or proc.poll() is not None:
+                    raise SystemExit("bot did not start polling")
+                await asyncio.sleep(0.05)
+        startup = time.perf_counter() - started
+        rss_start = rss_kb(proc.pid)
+        sampler = asyncio.create_task(sample_memory(proc.pid, memory))
+
+        async with aiohttp.ClientSession(headers={'X-Telegram-Bot-Api-Secret-Token': SECRET}) as session:
+            driver = Driver(api, args.mode, session, api.webhook and api.webhook['url'])
+            flows_by_user = {}
+            tasks = []
+            broadcast_task = None
+            if args.broadcast_at >= 0:
+                broadcast_task = asyncio.create_task(
+                    admin(driver, api, args.broadcast_at, args.broadcast_timeout))
+            load_started = time.perf_counter()
+            names, weights = list(mix), list(mix.values())
+            for i in range(args.users):
+                user_id = 100000 + i
+                flow = flows_by_user[user_id] = random.choices(names, weights)[0]
+                tasks.append(asyncio.create_task(student(driver, user_id, flow, args.think)))
+                # وصول Poisson بمعدل arrival-rate
+                await asyncio.sleep(random.expovariate(args.arrival_rate))
+            await asyncio.gather(*tasks)
+            load_elapsed = time.perf_counter() - load_started
+            broadcast_seconds = await broadcast_task if broadcast_task else None
+        sampler.cancel()
+        rss_end = rss_kb(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=60)
+        await api.stop()
+
+    per_flow_calls, deliveries = calls_per_flow(api, flows_by_user)
+    sessions = defaultdict(int)
+    for flow in flows_by_user.values():
+        sessions[flow] += 1
+    all_latencies = [value for values in driver.latencies.values() for value in values]
+    result = {
+        'mode': args.mode,
+        'users': args.users,
+        'startup_seconds': round(startup, 3),
+        'elapsed_seconds': round(load_elapsed, 3),
+        'steps': driver.steps,
+        'timeouts': driver.timeouts,
+        'throughput_updates_per_second': round(driver.steps / load_elapsed, 1),
+        'latency_ms': {
+            flow: {
+                'count': len(values),
+                'p50': round(percentile(values, 50) * 1000, 1),
+                'p95': round(percentile(values, 95) * 1000, 1),
+                'p99': round(percentile(values, 99) * 1000, 1),
+            }
+            for flow, values in [('all', all_latencies)] + sorted(driver.latencies.items())
+        },
+        'api_calls_per_flow': {
+            flow: round(per_flow_calls[flow] / (sessions[flow] or 1), 2)
+            for flow in sorted(set(sessions) | set(per_flow_calls))
+        },
+        'api_calls': dict(api.counts),
+        'broadcast_deliveries': deliveries,
+        'broadcast_seconds': None if broadcast_seconds is None else round(broadcast_seconds, 2),
+        'rss_kb': {
+            'start': rss_start,
+            'end': rss_end,
+            'peak': max(memory) if memory else None,
+            'growth': None if rss_start is None or rss_end is None else rss_end - rss_start,
+        },
+    }
+    return result
+
+
+def print_report(result):
+    print(f"mode:        {result['mode']}, {result['users']} users, "
+          f"ready after {result['startup_seconds']:.2f}s")
+    print(f"throughput:  {result['throughput_updates_per_second']} updates/s "
+          f"({result['steps']} steps in {result['elapsed_seconds']:.1f}s, {result['timeouts']} timeouts)")
+    print(f"\n{'flow':<12} {'steps':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'calls/flow':>10}")
+    for flow, stats in result['latency_ms'].items():
+        calls = result['api_calls_per_flow'].get(flow, '')
+        print(f"{flow:<12} {stats['count']:>6} {stats['p50']:>8} {stats['p95']:>8} {stats['p99']:>8} {calls:>10}")
+    if result['broadcast_seconds'] is not None:
+        print(f"\nbroadcast:   {result['broadcast_deliveries']} deliveries in {result['broadcast_seconds']}s")
+    rss = result['rss_kb']
+    if rss['start'] is not None:
+        print(f"memory:      {rss['start'] / 1024:.1f} MB -> {rss['end'] / 1024:.1f} MB "
+              f"(peak {rss['peak'] / 1024:.1f} MB, growth {rss['growth'] / 1024:+.1f} MB)")
+
+
+def check_gates(result, args):
+    failures = []
+    p99 = result['latency_ms']['all']['p99']
+    if args.max_p99_ms is not None and p99 > args.max_p99_ms:
+        failures.append(f"p99 {p99} ms > {args.max_p99_ms} ms")
+    if args.min_throughput is not None and result['throughput_updates_per_second'] < args.min_throughput:
+        failures.append(f"throughput {result['throughput_updates_per_second']} < {args.min_throughput}")
+    growth = result['rss_kb']['growth']
+    if args.max_rss_growth_mb is not None and growth is not None and growth / 1024 > args.max_rss_growth_mb:
+        failures.append(f"memory growth {growth / 1024:.1f} MB > {args.max_rss_growth_mb} MB")
+    if result['timeouts']:
+        failures.append(f"{result['timeouts']} steps got no reply")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=('polling', 'webhook'), default='polling')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--arrival-rate', type=float, default=50,
+                        help="new students per second (Poisson)")
+    parser.add_argument('--think', type=float, default=0.5,
+                        help="mean seconds a student waits between steps")
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help="flow weights, e.g. 'theoretical=3,blok=1'")
+    parser.add_argument('--broadcast-at', type=float, default=5,
+                        help="seconds into the run the admin starts /new; -1 to skip")
+    parser.add_argument('--broadcast-rate', type=float, default=500,
+                        help="BROADCAST_RATE for the bot under test")
+    parser.add_argument('--broadcast-timeout', type=float, default=300)
+    parser.add_argument('--api-latency', type=float, default=0.02,
+                        help="simulated Bot API round-trip in seconds")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--max-p99-ms', type=float)
+    parser.add_argument('--min-throughput', type=float)
+    parser.add_argument('--max-rss-growth-mb', type=float)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    failures = check_gates(result, args)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Memory and speed of the user registry against the old dict of ISO strings.
+
+For each size, builds both from the same users (ids spread like Telegram
+ids, last seen within 30 days): the dict the way JSONStorage.load_users
+did it, from users.json text. Reports bytes per user (tracemalloc), build
+time, touch/lookup cost, /active window counts and a full iteration.
+
+    python benchmarks/registry_memory.py --sizes 10000,100000,1000000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_registry import UserRegistry  # noqa: E402
+
+
+def make_users(size, now):
+    ids = random.sample(range(100_000_000, 7_000_000_000), size)
+    return [(user_id, now - random.randrange(30 * 86400)) for user_id in ids]
+
+
+def measure(build):
+    # الوقت بدون tracemalloc لأنه يبطئ كل تخصيص
+    gc.collect()
+    started = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size, elapsed
+
+
+def per_op(func, items):
+    started = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - started) / len(items) * 1e6
+
+
+def run(size, touches):
+    now = int(time.time())
+    users = make_users(size, now)
+    text = json.dumps({str(user_id): datetime.fromtimestamp(epoch).isoformat() for user_id, epoch in users})
+
+    old, old_bytes, old_build = measure(lambda: {int(k): v for k, v in json.loads(text).items()})
+    new, new_bytes, new_build = measure(lambda: UserRegistry(users))
+
+    known = [user_id for user_id, _ in random.sample(users, min(touches, size))]
+    fresh = random.sample(range(7_000_000_000, 8_000_000_000), touches)
+    stamp = datetime.now().isoformat()
+    result = {
+        'size': size,
+        'dict_bytes': old_bytes / size,
+        'registry_bytes': new_bytes / size,
+        'dict_build': old_build,
+        'registry_build': new_build,
+        'dict_touch_us': per_op(lambda u: old.__setitem__(u, stamp), known),
+        'registry_touch_us': per_op(lambda u: new.set(u, now), known),
+        'registry_new_us': per_op(lambda u: new.set(u, now), fresh),
+        'dict_lookup_us': per_op(old.__contains__, known),
+        'registry_lookup_us': per_op(new.__contains__, known),
+    }
+    started = time.perf_counter()
+    cutoff = datetime.fromtimestamp(now - 86400).isoformat()
+    sum(1 for seen in old.values() if seen >= cutoff)
+    result['dict_active_ms'] = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    new.count_since(24 * 30)
+    result['registry_active_ms'] = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    list(new)
+    result['registry_iter_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=lambda s: [int(n) for n in s.split(',')],
+                        default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--touches', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    print(f"{'users':>9} {'dict B/user':>11} {'reg B/user':>10} {'dict build':>10} {'reg build':>9} "
+          f"{'touch us':>13} {'new us':>6} {'lookup us':>13} {'/active ms':>15} {'iter ms':>7}")
+    for size in args.sizes:
+        r = run(size, args.touches)
+        print(f"{r['size']:>9} {r['dict_bytes']:>11.1f} {r['registry_bytes']:>10.1f} "
+              f"{r['dict_build']:>9.2f}s {r['registry_build']:>8.2f}s "
+              f"{r['dict_touch_us']:>6.2f}/{r['registry_touch_us']:<6.2f} {r['registry_new_us']:>6.2f} "
+              f"{r['dict_lookup_us']:>6.2f}/{r['registry_lookup_us']:<6.2f} "
+              f"{r['dict_active_ms']:>7.1f}/{r['registry_active_ms']:<7.3f} {r['registry_iter_ms']:>7.1f}")
+    print("(pairs are dict/registry; /active is a 24h scan vs a 30-day bucket sum)")
+
+
+if __name__ == '__main__':
+    main()
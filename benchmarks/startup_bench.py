@@ -0,0 +1,116 @@
+"""Restart-to-first-reply time of the bot with a populated user registry.
+
+Fills the storage with --users users, queues a /start in the fake Bot
+API, then starts the bot (server.py in polling mode, like Koyeb) and
+times the spawn until the reply is sent. Repeats --runs times and prints
+the median with the bot's own startup profile from its logs.
+
+    python benchmarks/startup_bench.py --users 100000 --backend sqlite
+    USERS_LAZY_LOAD=0 python benchmarks/startup_bench.py --users 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from fake_bot_api import FakeBotAPI, make_message_update
+from webhook_bench import REPO, free_port
+
+USER_ID = 4242
+
+
+def populate(workdir, backend, users):
+    now = time.time()
+    rows = [(10_000_000 + i * 7, datetime.fromtimestamp(now - i % (30 * 86400)).isoformat())
+            for i in range(users)]
+    if backend == 'sqlite':
+        conn = sqlite3.connect(os.path.join(workdir, 'bot.db'))
+        conn.execute("CREATE TABLE users (user_id INTEGER PRIMARY KEY, last_seen TEXT NOT NULL)")
+        conn.executemany("INSERT INTO users VALUES (?, ?)", rows)
+        conn.commit()
+        conn.close()
+    else:
+        with open(os.path.join(workdir, 'users.json'), 'w') as f:
+            json.dump({str(k): v for k, v in rows}, f)
+
+
+def read_profile(stream):
+    for line in stream.splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if entry.get('startup') and entry.get('msg', '').startswith('Startup profile'):
+            return entry['startup']
+    return None
+
+
+async def one_run(args, template):
+    workdir = tempfile.mkdtemp(prefix='bot-startup-')
+    for name in os.listdir(template):
+        os.link(os.path.join(template, name), os.path.join(workdir, name))
+    api = await FakeBotAPI().start()
+    # التحديث ينتظر من قبل التشغيل، مثل رسالة وصلت والبوت طافي
+    api.updates.put_nowait(make_message_update(api.next_update_id(), USER_ID, '/start'))
+    reply = api.wait_for_message(USER_ID)
+    env = dict(
+        os.environ,
+        BOT_TOKEN='123456:bench',
+        BOT_API_BASE_URL=api.base_url,
+        STORAGE_BACKEND=args.backend,
+        DROP_PENDING_UPDATES='0',
+        PORT=str(free_port()),
+        LOG_FORMAT='json',
+        PYTHONPATH=REPO,
+    )
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(REPO, args.entry)],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    try:
+        replied_at, _, _ = await asyncio.wait_for(reply, timeout=120)
+        elapsed = replied_at - started
+        # نخلي سجل الـ profile يوصل قبل الإيقاف
+        await asyncio.sleep(0.5)
+    finally:
+        proc.terminate()
+        _, stderr = await asyncio.to_thread(proc.communicate, timeout=60)
+        await api.stop()
+    return elapsed, read_profile(stderr)
+
+
+async def run(args):
+    template = tempfile.mkdtemp(prefix='bot-startup-template-')
+    populate(template, args.backend, args.users)
+    results = []
+    for _ in range(args.runs):
+        results.append(await one_run(args, template))
+    times = [elapsed for elapsed, _ in results]
+    print(f"{args.entry}, {args.backend}, {args.users} users, lazy={os.environ.get('USERS_LAZY_LOAD', '1')}")
+    print(f"first reply: median {statistics.median(times):.2f}s "
+          f"(runs: {', '.join(f'{t:.2f}' for t in times)})")
+    profile = results[len(results) // 2][1]
+    if profile:
+        for phase, values in profile.items():
+            print(f"  {phase:<14} {values['seconds']:>7.3f}s  at {values['since_start']:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--backend', choices=('sqlite', 'json'), default='sqlite')
+    parser.add_argument('--entry', default='server.py', help="server.py or main.py")
+    parser.add_argument('--runs', type=int, default=3)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
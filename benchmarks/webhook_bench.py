@@ -0,0 +1,111 @@
+"""Drive the bot in webhook mode against the fake Bot API.
+
+Starts the fake API, runs main.py in a subprocess with BOT_MODE=webhook,
+posts /start updates from many users and measures updates/sec and the
+latency from the webhook POST to the first reply the bot sends.
+
+    python benchmarks/webhook_bench.py --updates 2000 --users 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from fake_bot_api import FakeBotAPI, make_message_update
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET = 'bench-secret'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def start_bot(api, port, workdir, extra_env=None):
+    env = dict(
+        os.environ,
+        BOT_MODE='webhook',
+        BOT_TOKEN='123456:bench',
+        BOT_API_BASE_URL=api.base_url,
+        WEBHOOK_URL=f"http://127.0.0.1:{port}",
+        WEBHOOK_SECRET=SECRET,
+        PORT=str(port),
+        PYTHONPATH=REPO,
+    )
+    env.update(extra_env or {})
+    return subprocess.Popen(
+        [sys.executable, os.path.join(REPO, 'main.py')],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def run(args):
+    api = await FakeBotAPI(latency=args.api_latency).start()
+    port = free_port()
+    workdir = tempfile.mkdtemp(prefix='bot-bench-')
+    proc = start_bot(api, port, workdir)
+    try:
+        await asyncio.wait_for(api.webhook_ready.wait(), timeout=30)
+        url = api.webhook['url']
+        latencies = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+        # كل مستخدم ينتظر رده قبل رسالته التالية حتى تبقى القياسات لكل تحديث
+        user_locks = {}
+
+        async with aiohttp.ClientSession(headers={'X-Telegram-Bot-Api-Secret-Token': SECRET}) as session:
+            async def one(i):
+                user_id = 1000 + i % args.users
+                lock = user_locks.setdefault(user_id, asyncio.Lock())
+                async with lock, semaphore:
+                    reply = api.wait_for_message(user_id)
+                    started = time.perf_counter()
+                    update = make_message_update(api.next_update_id(), user_id, '/start')
+                    async with session.post(url, json=update) as resp:
+                        resp.release()
+                    replied_at, _, _ = await asyncio.wait_for(reply, timeout=30)
+                    latencies.append(replied_at - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.updates)))
+            elapsed = time.perf_counter() - started
+
+        print(f"updates:          {args.updates} from {args.users} users")
+        print(f"throughput:       {args.updates / elapsed:.1f} updates/s")
+        print(f"latency p50:      {percentile(latencies, 50) * 1000:.1f} ms")
+        print(f"latency p99:      {percentile(latencies, 99) * 1000:.1f} ms")
+        print(f"latency mean:     {statistics.mean(latencies) * 1000:.1f} ms")
+        print(f"api calls:        {dict(api.counts)}")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--api-latency', type=float, default=0.0,
+                        help="seconds the fake API waits before answering each call")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
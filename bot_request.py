@@ -0,0 +1,49 @@
+import time
+
+from telegram.request import HTTPXRequest
+
+import metrics
+from health import monitor
+from startup import profile as startup_profile
+
+api_latency = metrics.Histogram(
+    'bot_api_request_seconds', "Bot API round-trip time by method", ['method']
+)
+api_requests = metrics.Counter(
+    'bot_api_requests_total', "Bot API requests by method and HTTP status", ['method', 'status']
+)
+
+# آخر نجاح لكل method (time.monotonic)، للـ health checks
+last_success = {}
+
+
+def mean_latency(method):
+    """Average seconds per successful or failed `method` call so far, or None."""
+    series = api_latency.values.get((method,))
+    if not series or not series[-2]:
+        return None
+    return series[-1] / series[-2]
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records count, status and latency of every Bot API call."""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            status, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+        except Exception:
+            api_requests.inc(api_method, 'error')
+            raise
+        finally:
+            api_latency.observe(time.perf_counter() - started, api_method)
+        api_requests.inc(api_method, str(status))
+        if status == 200:
+            last_success[api_method] = time.monotonic()
+            if api_method == 'getUpdates':
+                monitor.fetched()
+            elif api_method.startswith('send') and 'first_reply' not in startup_profile.phases:
+                startup_profile.mark('first_reply')
+                startup_profile.log()
+        return status, payload
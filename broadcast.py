@@ -0,0 +1,582 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+import metrics
+from storage import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# حدود تيليجرام: ~30 رسالة بالثانية للبوت، ورسالة وحدة بالثانية لكل محادثة
+GLOBAL_RATE = 25.0
+PER_CHAT_INTERVAL = 1.0
+DEFAULT_CONCURRENCY = 16
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+PROGRESS_INTERVAL = 10.0
+CHECKPOINT_INTERVAL = 1.0
+# كم مستلم نحجز بالملف قبل ما نبدي نرسلهم
+CLAIM_BLOCK = 64
+JOBS_DIR = 'broadcast_jobs'
+# ملفات البثوث المنتهية أو الملغية تنحذف بعد هالمدة؛ ما تنحمل عند التشغيل أصلاً
+FINISHED_JOB_RETENTION = 7 * 86400
+TERMINAL_STATUSES = ('done', 'cancelled')
+
+# أنواع الوسائط المدعومة بالبث ودالة الإرسال لكل نوع
+MEDIA_METHODS = {
+    'photo': 'send_photo',
+    'animation': 'send_animation',
+    'video': 'send_video',
+    'document': 'send_document',
+}
+
+# أخطاء تعني أن المحادثة ما عادت موجودة أو البوت محظور فيها
+GONE_CHAT_ERRORS = (
+    'chat not found',
+    'user is deactivated',
+    'bot was blocked by the user',
+    'peer_id_invalid',
+)
+
+
+class TokenBucket:
+    """Async token bucket; `pause()` stops handing out tokens for a while."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+broadcast_messages = metrics.Counter(
+    'bot_broadcast_messages_total', "Broadcast deliveries by outcome", ['outcome']
+)
+broadcast_retries = metrics.Counter(
+    'bot_broadcast_retries_total', "Broadcast sends retried after flood control or network errors"
+)
+
+
+def is_gone_chat(error):
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and any(
+        reason in error.message.lower() for reason in GONE_CHAT_ERRORS
+    )
+
+
+def estimate_seconds(count, rate=GLOBAL_RATE, concurrency=DEFAULT_CONCURRENCY, latency=None):
+    """Expected send time: the rate limit, unless `latency` per send caps it first."""
+    seconds = count / rate
+    if latency:
+        seconds = max(seconds, count * latency / concurrency)
+    return seconds
+
+
+def format_duration(seconds):
+    if seconds < 1:
+        return "أقل من ثانية"
+    seconds = int(seconds + 0.5)
+    if seconds < 60:
+        return f"{seconds} ثانية"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} دقيقة و{seconds} ثانية"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} ساعة و{minutes} دقيقة"
+
+
+def payload_from_message(message):
+    """What to broadcast for an admin's message, or None if it can't be sent.
+
+    Media is referenced by the file_id Telegram gave the admin's copy, so
+    the file is never uploaded again: each recipient costs one small
+    send_* call whatever the file size.
+    """
+    # الصور تجي بعدة أحجام؛ الأخير هو الأكبر
+    if message.photo:
+        return {'kind': 'photo', 'file_id': message.photo[-1].file_id, 'caption': message.caption}
+    # الـ animation قبل document: رسالة الـ GIF فيها الاثنين
+    for kind in ('animation', 'video', 'document'):
+        media = getattr(message, kind)
+        if media is not None:
+            return {'kind': kind, 'file_id': media.file_id, 'caption': message.caption}
+    if message.text:
+        return {'text': message.text}
+    return None
+
+
+def api_method(payload):
+    # اسم الطريقة بـ Bot API (sendPhoto...)، لمعدل الزمن بـ /metrics
+    kind = payload.get('kind')
+    return 'send' + kind.capitalize() if kind else 'sendMessage'
+
+
+class Broadcast:
+    """Sends one message to an audience with bounded concurrency and rate limits.
+
+    `payload` is {'text': ...} or {'kind': 'photo', 'file_id': ..., 'caption': ...}
+    (see payload_from_message).
+    """
+
+    def __init__(self, bot, audience, payload, concurrency=DEFAULT_CONCURRENCY,
+                 rate=GLOBAL_RATE, on_gone=None):
+        self.bot = bot
+        self.audience = list(audience)
+        self.payload = payload
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate)
+        self.on_gone = on_gone
+
+        self.sent = 0
+        self.failed = 0
+        self.gone = 0
+        self.retries = 0
+        self.started = None
+        self.finished = None
+        self._sent_before_run = 0
+        self._cursor = 0
+        self._last_sent_to = {}
+
+    @property
+    def total(self):
+        return len(self.audience)
+
+    @property
+    def unsuccessful(self):
+        return self.failed + self.gone
+
+    @property
+    def remaining(self):
+        return self.total - self.sent - self.unsuccessful
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rate(self):
+        return (self.sent - self._sent_before_run) / self.elapsed if self.elapsed else 0.0
+
+    def progress_text(self):
+        return (
+            f"📤 البث: {self.sent} تم، {self.unsuccessful} فشل، "
+            f"{self.remaining} متبقي ({self.rate:.1f} رسالة/ث)"
+        )
+
+    def summary_text(self):
+        return (
+            f"✔ انتهى البث خلال {self.elapsed:.0f} ثانية.\n"
+            f"• تم الإرسال: {self.sent}\n"
+            f"• فشل: {self.failed}\n"
+            f"• محادثات محذوفة/محظورة: {self.gone}\n"
+            f"• المعدل: {self.rate:.1f} رسالة/ث"
+        )
+
+    async def _next(self):
+        # يرجع رقم المستلم التالي أو None إذا خلصنا
+        if self._cursor >= self.total:
+            return None
+        index = self._cursor
+        self._cursor += 1
+        return index
+
+    async def _respect_chat_interval(self, chat_id):
+        last = self._last_sent_to.get(chat_id)
+        if last is not None:
+            wait = PER_CHAT_INTERVAL - (time.monotonic() - last)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    async def _send(self, chat_id):
+        payload = self.payload
+        kind = payload.get('kind')
+        if kind is None:
+            await self.bot.send_message(chat_id=chat_id, text=payload['text'])
+        else:
+            await getattr(self.bot, MEDIA_METHODS[kind])(chat_id, payload['file_id'], caption=payload.get('caption'))
+
+    async def _deliver(self, chat_id):
+        # يرجع 'sent' أو 'gone' أو 'failed'
+        for attempt in range(MAX_ATTEMPTS):
+            await self._respect_chat_interval(chat_id)
+            await self.bucket.acquire()
+            try:
+                self._last_sent_to[chat_id] = time.monotonic()
+                await self._send(chat_id)
+                return 'sent'
+            except RetryAfter as e:
+                self.retries += 1
+                broadcast_retries.inc()
+                logger.warning("Broadcast hit flood control, pausing %ss", e.retry_after)
+                self.bucket.pause(e.retry_after)
+            except (Forbidden, BadRequest) as e:
+                if is_gone_chat(e):
+                    return 'gone'
+                logger.warning("Broadcast to %s failed: %s", chat_id, e)
+                return 'failed'
+            except NetworkError as e:
+                self.retries += 1
+                broadcast_retries.inc()
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+                logger.warning("Broadcast to %s network error (%s), retry in %.1fs", chat_id, e, delay)
+                await asyncio.sleep(delay)
+            except Exception:
+                # ChatMigrated أو أي خطأ ثاني: يفشل هالمستلم بس، وما يوقف البث كله
+                logger.exception("Broadcast to %s failed", chat_id)
+                return 'failed'
+        return 'failed'
+
+    def _record(self, index, outcome):
+        broadcast_messages.inc(outcome)
+        if outcome == 'sent':
+            self.sent += 1
+        elif outcome == 'gone':
+            self.gone += 1
+            if self.on_gone is not None:
+                self.on_gone(self.audience[index])
+        else:
+            self.failed += 1
+
+    async def _worker(self):
+        # كل الـ workers يسحبون من نفس المؤشر فما تتكرر أي محادثة
+        while True:
+            index = await self._next()
+            if index is None:
+                return
+            self._record(index, await self._deliver(self.audience[index]))
+
+    async def run(self):
+        self.started = time.monotonic()
+        self.finished = None
+        self._sent_before_run = self.sent
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+            self.finished = time.monotonic()
+        return self
+
+
+class BroadcastJob(Broadcast):
+    """A Broadcast persisted under JOBS_DIR so it can be resumed after a restart.
+
+    `<id>.json` holds the payload and the audience snapshot and is written
+    once; `<id>.state.json` holds the status, counters, a done-bitmap and a
+    claim cursor. Recipients are claimed on disk in blocks before they are
+    sent, so a crash can lose at most one block but never sends twice.
+    """
+
+    def __init__(self, bot, job_id, audience, payload, admin_chat_id, jobs_dir=JOBS_DIR, **kwargs):
+        super().__init__(bot, audience, payload, **kwargs)
+        self.job_id = job_id
+        self.admin_chat_id = admin_chat_id
+        self.jobs_dir = jobs_dir
+        self.status = 'running'
+        self.lost = 0
+        self.claimed = 0
+        self.done = bytearray((self.total + 7) // 8)
+        self._dirty = False
+        self._claim_lock = asyncio.Lock()
+        # كل لقطة للحالة إلها رقم؛ الكتابة الأقدم ما تغطي على الأحدث
+        self._state_version = 0
+        self._written_version = 0
+        self._write_lock = threading.Lock()
+
+    @property
+    def unsuccessful(self):
+        return self.failed + self.gone + self.lost
+
+    def describe(self):
+        return (
+            f"{self.job_id} [{self.status}] {self.sent}/{self.total} تم، "
+            f"{self.unsuccessful} فشل، {self.remaining} متبقي"
+        )
+
+    def summary_text(self):
+        if self.status == 'stopping':
+            # البوت دا ينطفي، البث راح يكمل بعد التشغيل
+            return None
+        if self.status != 'done':
+            return f"⏸ {self.describe()}"
+        return super().summary_text() + f"\n• غير مؤكد بعد إعادة تشغيل: {self.lost}"
+
+    def _path(self, suffix):
+        return os.path.join(self.jobs_dir, f"{self.job_id}{suffix}")
+
+    def is_done(self, index):
+        return self.done[index >> 3] & (1 << (index & 7))
+
+    def save_meta(self, created=None):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        write_json_atomic(self._path('.json'), {
+            'id': self.job_id,
+            'admin_chat_id': self.admin_chat_id,
+            'created': created or time.time(),
+            # الـ file_id ينحفظ هنا، فالاستئناف يرسل نفس الملف بدون رفع
+            'payload': self.payload,
+            'audience': self.audience,
+        }, ensure_ascii=False)
+
+    def _state(self):
+        return {
+            'status': self.status,
+            'claimed': self.claimed,
+            'sent': self.sent,
+            'failed': self.failed,
+            'gone': self.gone,
+            'lost': self.lost,
+            'done': base64.b64encode(bytes(self.done)).decode('ascii'),
+        }
+
+    def _snapshot(self):
+        self._dirty = False
+        self._state_version += 1
+        return self._state_version, self._state()
+
+    def _write_state(self, version, state):
+        # الكتابات تشتغل بـ threads وممكن تخلص بغير ترتيبها؛ لو لقطة أقدم
+        # كتبت بعد الأحدث يرجع claimed لورا وينعاد الإرسال بعد crash
+        with self._write_lock:
+            if version <= self._written_version:
+                return
+            write_json_atomic(self._path('.state.json'), state)
+            self._written_version = version
+
+    def save_state(self):
+        self._write_state(*self._snapshot())
+
+    async def save_state_async(self):
+        await asyncio.to_thread(self._write_state, *self._snapshot())
+
+    @classmethod
+    def load(cls, bot, meta_path, **kwargs):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        job = cls(
+            bot, meta['id'], meta['audience'], meta['payload'], meta['admin_chat_id'],
+            jobs_dir=os.path.dirname(meta_path), **kwargs
+        )
+        state_path = job._path('.state.json')
+        if os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            job.status = state['status']
+            job.claimed = state['claimed']
+            job.sent = state['sent']
+            job.failed = state['failed']
+            job.gone = state['gone']
+            job.lost = state['lost']
+            job.done[:] = base64.b64decode(state['done'])
+        # اللي انحجزوا وما تأكدوا: ما نعرف وصلتهم أو لا، فما نعيد إرسالهم
+        for index in range(job.claimed):
+            if not job.is_done(index):
+                job.done[index >> 3] |= 1 << (index & 7)
+                job.lost += 1
+        job._cursor = job.claimed
+        return job
+
+    async def _next(self):
+        if self.status != 'running':
+            return None
+        async with self._claim_lock:
+            if self._cursor >= self.total:
+                return None
+            if self._cursor >= self.claimed:
+                self.claimed = min(self.total, self._cursor + CLAIM_BLOCK)
+                await self.save_state_async()
+            index = self._cursor
+            self._cursor += 1
+            return index
+
+    def _record(self, index, outcome):
+        super()._record(index, outcome)
+        self.done[index >> 3] |= 1 << (index & 7)
+        self._dirty = True
+
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(CHECKPOINT_INTERVAL)
+            if self._dirty:
+                await self.save_state_async()
+
+    async def run(self):
+        checkpoint = asyncio.create_task(self._checkpoint_loop())
+        try:
+            await super().run()
+            if self.status == 'running' and self._cursor >= self.total:
+                self.status = 'done'
+        finally:
+            checkpoint.cancel()
+            # الـ workers خلصوا كل اللي سحبوه، فالحجز يرجع للمؤشر
+            self.claimed = self._cursor
+            self.save_state()
+        return self
+
+
+class JobManager:
+    """Keeps the broadcast jobs of this process and their asyncio tasks."""
+
+    def __init__(self, bot, jobs_dir=JOBS_DIR, **job_kwargs):
+        self.bot = bot
+        self.jobs_dir = jobs_dir
+        self.job_kwargs = job_kwargs
+        self.jobs = {}
+        self.tasks = {}
+
+    def load_all(self):
+        if not os.path.isdir(self.jobs_dir):
+            return
+        for name in sorted(os.listdir(self.jobs_dir)):
+            if not name.endswith('.json') or name.endswith('.state.json'):
+                continue
+            if self._finished(name):
+                continue
+            try:
+                job = BroadcastJob.load(self.bot, os.path.join(self.jobs_dir, name), **self.job_kwargs)
+            except (OSError, ValueError, KeyError):
+                logger.exception("Could not load broadcast job %s", name)
+                continue
+            self.jobs[job.job_id] = job
+
+    def _finished(self, name):
+        """True for a done or cancelled job; removes its files once expired.
+
+        Finished jobs keep their whole audience, so loading them on every
+        start would only grow memory; they stay on disk for a while to be
+        looked at by hand.
+        """
+        meta_path = os.path.join(self.jobs_dir, name)
+        state_path = meta_path[:-len('.json')] + '.state.json'
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                status = json.load(f).get('status')
+            finished_at = os.path.getmtime(state_path)
+        except (OSError, ValueError):
+            return False
+        if status not in TERMINAL_STATUSES:
+            return False
+        if time.time() - finished_at > FINISHED_JOB_RETENTION:
+            for path in (meta_path, state_path):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            logger.info("Removed finished broadcast job %s", name[:-len('.json')])
+        return True
+
+    def create(self, audience, payload, admin_chat_id):
+        job = BroadcastJob(
+            self.bot, uuid.uuid4().hex[:8], audience, payload, admin_chat_id,
+            jobs_dir=self.jobs_dir, **self.job_kwargs
+        )
+        job.save_meta()
+        job.save_state()
+        self.jobs[job.job_id] = job
+        return job
+
+    def start(self, job):
+        # إذا البث بعده دا يوقف ما نشغله مرتين
+        if job.job_id in self.tasks:
+            return False
+        job.status = 'running'
+        # asyncio.create_task وليس application.create_task: الأخير يأخر الإيقاف لحد ما يخلص البث
+        task = asyncio.create_task(run_with_progress(job, self.bot, job.admin_chat_id))
+        self.tasks[job.job_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(job.job_id, None))
+        return True
+
+    def resume_all(self):
+        self.load_all()
+        for job in self.jobs.values():
+            if job.status == 'running':
+                logger.info("Resuming broadcast %s at %s/%s", job.job_id, job.claimed, job.total)
+                self.start(job)
+
+    def pause(self, job):
+        if job.status == 'running':
+            job.status = 'paused'
+            if job.job_id not in self.tasks:
+                job.save_state()
+
+    def cancel(self, job):
+        if job.status in ('running', 'paused'):
+            job.status = 'cancelled'
+            if job.job_id not in self.tasks:
+                job.save_state()
+
+    async def shutdown(self):
+        # نوقف كل البثوث بهدوء؛ الحالة تبقى running حتى تكمل بعد إعادة التشغيل
+        tasks = list(self.tasks.values())
+        for job_id in self.tasks:
+            job = self.jobs[job_id]
+            # الموقوف أو الملغي قبل الإيقاف بلحظة يبقى على حاله وما يستأنف
+            if job.status == 'running':
+                job.status = 'stopping'
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job in self.jobs.values():
+            if job.status == 'stopping':
+                job.status = 'running'
+                job.save_state()
+
+
+async def run_with_progress(broadcast, bot, admin_chat_id, interval=PROGRESS_INTERVAL):
+    """Runs `broadcast` while editing one progress message in the admin chat."""
+    shown = broadcast.progress_text()
+    progress = await bot.send_message(chat_id=admin_chat_id, text=shown)
+    task = asyncio.create_task(broadcast.run())
+    while not task.done():
+        await asyncio.wait({task}, timeout=interval)
+        text = broadcast.progress_text()
+        # تيليجرام يرفض تعديل رسالة بنفس النص
+        if task.done() or text == shown:
+            continue
+        shown = text
+        try:
+            await progress.edit_text(text)
+        except Exception as e:
+            logger.warning("Failed to update broadcast progress: %s", e)
+    try:
+        task.result()
+    except Exception:
+        logger.exception("Broadcast crashed")
+    logger.info(
+        "Broadcast finished: sent=%s failed=%s gone=%s retries=%s elapsed=%.1fs rate=%.1f/s",
+        broadcast.sent, broadcast.failed, broadcast.gone, broadcast.retries,
+        broadcast.elapsed, broadcast.rate,
+    )
+    summary = broadcast.summary_text()
+    if summary:
+        await bot.send_message(chat_id=admin_chat_id, text=summary)
+    return broadcast
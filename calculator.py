@@ -0,0 +1,127 @@
+import os
+import re
+
+# الغياب المسموح = الكردت × عدد الأسابيع × النسبة
+ABSENCE_WEEKS = float(os.environ.get("CALC_ABSENCE_WEEKS", "8"))
+THEORETICAL_RATIO = float(os.environ.get("CALC_THEORETICAL_RATIO", "0.2352941176"))  # 4/17
+PRACTICAL_RATIO = float(os.environ.get("CALC_PRACTICAL_RATIO", "0.1176470588"))  # 2/17
+
+# أكثر عدد مواد برسالة وحدة
+MAX_BATCH = int(os.environ.get("CALC_MAX_BATCH", "30"))
+
+# قيم الكردت الشائعة محسوبة مسبقاً
+COMMON_CREDITS = (0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5, 6)
+
+KINDS = {
+    'theoretical': ('نظري', THEORETICAL_RATIO),
+    'practical': ('عملي', PRACTICAL_RATIO),
+}
+
+# أرقام عربية-هندية وفارسية والفاصلة العشرية العربية
+_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹٫', '01234567890123456789.')
+# نفس اللي يقبله float(): ".5" و "5." و "1e3"؛ الرقم ما يلتصق بحرف إنكليزي
+# أو نقطة، فـ "3e" و "1.2.3" مرفوضة بدل ما تنقسم لأرقام وعنوان
+_NUMBER = re.compile(r'(?<![A-Za-z0-9.])[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?![A-Za-z0-9.])')
+_DIGIT = re.compile(r'\d')
+# فواصل بين القيم بنفس السطر: فاصلة إنكليزية/عربية أو فاصلة منقوطة
+_SEPARATORS = re.compile(r'[,،;؛]')
+
+
+def absence(kind, credit):
+    return credit * ABSENCE_WEEKS * KINDS[kind][1]
+
+
+LOOKUP = {
+    kind: {credit: absence(kind, credit) for credit in COMMON_CREDITS}
+    for kind in KINDS
+}
+
+
+def allowed_absence(kind, credit):
+    cached = LOOKUP[kind].get(credit)
+    return absence(kind, credit) if cached is None else cached
+
+
+def blok_grade(materia, total, taken):
+    if total <= 0:
+        raise ValueError("total must be positive")
+    return materia * taken / total
+
+
+def parse_entries(text, split_commas=True):
+    """Splits a message into (label, [numbers]) entries.
+
+    Lines (and commas, unless `split_commas` is off) separate entries;
+    within an entry, words before the numbers become the label
+    ("رياضيات 3" -> ("رياضيات", [3.0])).
+    Raises ValueError naming the first entry without a number.
+    """
+    entries = []
+    for line in text.translate(_DIGITS).splitlines():
+        for part in _SEPARATORS.split(line) if split_commas else [line]:
+            part = part.strip()
+            if not part:
+                continue
+            numbers = _NUMBER.findall(part)
+            if not numbers:
+                raise ValueError(part)
+            label = _SEPARATORS.sub(' ', _NUMBER.sub(' ', part)).strip(' :-=') or None
+            # رقم ما انقرأ كامل (مثل "5x") ما يصير عنوان
+            if label and _DIGIT.search(label):
+                raise ValueError(part)
+            entries.append((label, [float(n) for n in numbers]))
+    if len(entries) > MAX_BATCH:
+        raise OverflowError(len(entries))
+    return entries
+
+
+def _format(value):
+    return f"{value:.2f}"
+
+
+def _name(label, value):
+    shown = f"{value:g}"
+    return f"{label} ({shown})" if label else shown
+
+
+def absence_reply(kind, text):
+    """Reply for one or many credits in `text`; raises ValueError on bad input."""
+    title = KINDS[kind][0]
+    entries = parse_entries(text)
+    if not entries:
+        raise ValueError(text)
+    credits = [(label, value) for label, numbers in entries for value in numbers]
+    if any(value <= 0 for _, value in credits):
+        raise ValueError(text)
+    if len(credits) == 1:
+        return f"غيابك لل{title} هو: {_format(allowed_absence(kind, credits[0][1]))}"
+    lines = [f"غيابك لل{title}:"]
+    for label, credit in credits:
+        lines.append(f"• {_name(label, credit)}: {_format(allowed_absence(kind, credit))}")
+    return "\n".join(lines)
+
+
+def blok_batch_reply(text):
+    """Reply when every entry has all three blok numbers, else None.
+
+    An entry is "materia total taken", e.g. "40 100 80" or
+    "فسلجة 40 100 80"; several entries go on separate lines.
+    """
+    # "40, 100, 80" مادة وحدة، فالفاصلة هنا بين الأرقام مو بين المواد
+    entries = parse_entries(text, split_commas=False)
+    if not entries or any(len(numbers) != 3 for _, numbers in entries):
+        return None
+    results = [(label, blok_grade(*numbers)) for label, numbers in entries]
+    if len(results) == 1:
+        return f"درجتك بلبلوك هي: {_format(results[0][1])}"
+    lines = ["درجاتك بلبلوك:"]
+    for index, (label, result) in enumerate(results, start=1):
+        lines.append(f"• {label or index}: {_format(result)}")
+    return "\n".join(lines)
+
+
+def lookup_table(kind):
+    title = KINDS[kind][0]
+    lines = [f"جدول غياب ال{title} (الكردت ← الغياب المسموح):"]
+    lines.extend(f"{credit:g} ← {_format(value)}" for credit, value in LOOKUP[kind].items())
+    return "\n".join(lines)
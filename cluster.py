@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# ingress.py يعطي كل worker رقمه وعدد الـ workers؛ بدونها البوت عملية وحدة
+SHARD_INDEX = int(os.environ.get("CLUSTER_SHARD_INDEX", "0"))
+SHARD_COUNT = int(os.environ.get("CLUSTER_SHARD_COUNT", "1"))
+# عنوان الـ ingress اللي يوزع تغييرات الكتم/الترحيب على باقي الـ workers
+INGRESS_URL = os.environ.get("CLUSTER_INGRESS_URL", "").rstrip('/')
+CONTROL_PATH = '/cluster/control'
+CONTROL_SECRET = os.environ.get("CLUSTER_SECRET", "")
+CONTROL_HEADER = 'X-Cluster-Secret'
+PUBLISH_RETRIES = 3
+
+enabled = SHARD_COUNT > 1
+
+
+def raw_ordering_key(data):
+    """Same key as update_processor.ordering_key, read from the raw update JSON.
+
+    The ingress never builds telegram.Update objects: the first object in
+    the update (message, callback_query, ...) carries `from` and/or `chat`.
+    """
+    for field, value in data.items():
+        if field == 'update_id' or not isinstance(value, dict):
+            continue
+        user = value.get('from') or value.get('user')
+        if isinstance(user, dict) and 'id' in user:
+            return user['id']
+        chat = value.get('chat')
+        if chat is None and isinstance(value.get('message'), dict):
+            chat = value['message'].get('chat')
+        if isinstance(chat, dict) and 'id' in chat:
+            return chat['id']
+    return None
+
+
+def shard_for(key, count):
+    # المعرفات موزعة بانتظام، فالباقي يكفي؛ التحديثات بدون مستخدم تروح للأول
+    return 0 if key is None else key % count
+
+
+_handlers = {}
+_pending = set()
+_session = None
+
+
+def on_change(kind, handler):
+    """Registers handler(user_id, value) for changes published by other workers."""
+    _handlers[kind] = handler
+
+
+def apply(message):
+    handler = _handlers.get(message.get('kind'))
+    if handler is None:
+        logger.warning("Unknown cluster change: %s", message.get('kind'))
+        return False
+    handler(message['user_id'], message.get('value'))
+    return True
+
+
+def publish(kind, user_id, value=None):
+    """Tells the other workers about a change; returns without waiting."""
+    if not INGRESS_URL:
+        return
+    message = {'origin': SHARD_INDEX, 'kind': kind, 'user_id': user_id, 'value': value}
+    task = asyncio.get_running_loop().create_task(_post(message))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+async def _post(message):
+    # aiohttp بس لما يكون فيه ingress، حتى وضع polling ما يحمله
+    import aiohttp
+
+    global _session
+    if _session is None:
+        _session = aiohttp.ClientSession(
+            headers={CONTROL_HEADER: CONTROL_SECRET},
+            timeout=aiohttp.ClientTimeout(total=10),
+        )
+    for attempt in range(PUBLISH_RETRIES):
+        try:
+            async with _session.post(INGRESS_URL + CONTROL_PATH, json=message) as resp:
+                if resp.status == 200:
+                    return
+                logger.warning("Ingress refused cluster change (%s)", resp.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Could not publish cluster change: %s", e)
+        await asyncio.sleep(0.5 * 2 ** attempt)
+    # التخزين المشترك فيه القيمة الصحيحة؛ الـ workers الثانية تشوفها بعد إعادة التشغيل
+    logger.error("Dropped cluster change %s for %s", message['kind'], message['user_id'])
+
+
+async def close():
+    global _session
+    if _pending:
+        await asyncio.wait(set(_pending), timeout=5)
+    if _session is not None:
+        await _session.close()
+        _session = None
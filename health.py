@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import os
+import time
+
+from startup import profile as startup_profile
+
+logger = logging.getLogger(__name__)
+
+# فترة قياس تأخر الـ event loop (ثواني)
+PROBE_INTERVAL = float(os.environ.get("HEALTH_PROBE_INTERVAL", "1"))
+# readiness تفشل إذا تأخر الـ loop أكثر من هذا
+MAX_LOOP_LAG = float(os.environ.get("HEALTH_MAX_LOOP_LAG", "2"))
+# liveness تفشل إذا الـ loop واقف تماماً هالمدة
+MAX_LOOP_STALL = float(os.environ.get("HEALTH_MAX_LOOP_STALL", "30"))
+# بوضع polling: getUpdates يرجع كل ~10 ثواني حتى بدون رسائل
+MAX_POLL_AGE = float(os.environ.get("HEALTH_MAX_POLL_AGE", "60"))
+MAX_QUEUE_DEPTH = int(os.environ.get("HEALTH_MAX_QUEUE_DEPTH", "5000"))
+# فحص الكتابة على التخزين يلمس القرص، فما نسويه بكل probe
+STORAGE_CHECK_INTERVAL = float(os.environ.get("HEALTH_STORAGE_CHECK_INTERVAL", "30"))
+
+
+class HealthMonitor:
+    """Tracks what liveness/readiness probes need, readable from any thread.
+
+    A task on the bot's event loop wakes every `interval` seconds and
+    records how late it woke up (loop lag) and when (heartbeat). If the
+    loop is blocked the heartbeat goes stale, which the health server
+    thread can still see. Storage writability is probed from a worker
+    thread every STORAGE_CHECK_INTERVAL seconds and cached.
+    """
+
+    def __init__(self, interval=PROBE_INTERVAL):
+        self.interval = interval
+        self.polling = True
+        self.started_at = time.monotonic()
+        self.running_since = None
+        self.last_tick = None
+        self.lag = 0.0
+        self.max_lag_seen = 0.0
+        # getUpdates ناجح أو تحديث وصل عبر الـ webhook
+        self.last_fetch = None
+        self.storage = None
+        self.storage_ok = None
+        self.storage_error = None
+        self.storage_checked = None
+        self.queue_depth = lambda: 0
+        self.last_processed = lambda: None
+        self._task = None
+
+    def fetched(self):
+        if self.last_fetch is None:
+            startup_profile.mark('first_fetch')
+        self.last_fetch = time.monotonic()
+
+    def _check_storage(self):
+        try:
+            self.storage.check_writable()
+        except Exception as e:
+            if self.storage_ok is not False:
+                logger.error("Storage is not writable: %s", e)
+            self.storage_ok, self.storage_error = False, str(e)
+        else:
+            self.storage_ok, self.storage_error = True, None
+        self.storage_checked = time.monotonic()
+
+    async def _run(self):
+        next_storage_check = 0.0
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag = max(0.0, now - before - self.interval)
+            self.max_lag_seen = max(self.max_lag_seen, self.lag)
+            self.last_tick = now
+            if self.storage is not None and now >= next_storage_check:
+                next_storage_check = now + STORAGE_CHECK_INTERVAL
+                await asyncio.to_thread(self._check_storage)
+
+    def start(self):
+        if self._task is None:
+            self.running_since = self.last_tick = time.monotonic()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def loop_lag(self, now):
+        if self.last_tick is None:
+            return None
+        # إذا الـ loop واقف الآن، التأخر الحالي أكبر من آخر قياس
+        return max(self.lag, now - self.last_tick - self.interval)
+
+    def report(self):
+        now = time.monotonic()
+
+        def age(moment):
+            return None if moment is None else round(now - moment, 3)
+
+        lag = self.loop_lag(now)
+        fetch_age = age(self.last_fetch)
+        depth = self.queue_depth()
+
+        live_problems = []
+        if self._task is None:
+            live_problems.append('event loop monitor not running')
+        elif lag > MAX_LOOP_STALL:
+            live_problems.append(f'event loop stalled for {lag:.1f}s')
+        elif self.polling and now - (self.last_fetch or self.running_since) > MAX_POLL_AGE:
+            live_problems.append(f'no successful getUpdates for {now - (self.last_fetch or self.running_since):.0f}s')
+
+        ready_problems = list(live_problems)
+        if not live_problems:
+            if lag > MAX_LOOP_LAG:
+                ready_problems.append(f'event loop lag {lag:.2f}s')
+            if self.polling and self.last_fetch is None:
+                ready_problems.append('waiting for the first getUpdates')
+        if self.storage_ok is False:
+            ready_problems.append(f'storage not writable: {self.storage_error}')
+        if depth > MAX_QUEUE_DEPTH:
+            ready_problems.append(f'update queue depth {depth}')
+
+        return {
+            'mode': 'polling' if self.polling else 'webhook',
+            'uptime_seconds': round(now - self.started_at, 3),
+            'loop_lag_seconds': None if lag is None else round(lag, 4),
+            'max_loop_lag_seconds': round(self.max_lag_seen, 4),
+            'last_update_processed_seconds_ago': age(self.last_processed()),
+            'last_fetch_seconds_ago': fetch_age,
+            'update_queue_depth': depth,
+            'storage_writable': self.storage_ok,
+            'storage_checked_seconds_ago': age(self.storage_checked),
+            'live': not live_problems,
+            'ready': not ready_problems,
+            'problems': ready_problems,
+            'startup': startup_profile.report(),
+        }
+
+
+monitor = HealthMonitor()
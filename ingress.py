@@ -0,0 +1,308 @@
+"""Webhook front end that spreads updates over several bot processes.
+
+Starts INGRESS_WORKERS copies of main.py in webhook mode on local ports,
+registers its own address with Telegram and forwards every update to the
+worker picked from the user id, so a user's conversation always lives in
+the same process. Mute/welcome changes a worker makes are relayed to the
+others; users, conversations and broadcasts are shared through SQLite.
+
+    BOT_TOKEN=... WEBHOOK_URL=https://bot.example.com INGRESS_WORKERS=4 python ingress.py
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+import cluster
+import metrics
+from log_setup import setup_logging
+from webhook import SECRET_HEADER, WebhookConfig
+
+setup_logging()
+logger = logging.getLogger('ingress')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# عدد عمليات البوت؛ الافتراضي عدد الأنوية
+INGRESS_WORKERS = int(os.environ.get("INGRESS_WORKERS", os.cpu_count() or 1))
+# worker رقم i يسمع على INGRESS_WORKER_PORT + i (محلياً فقط)
+INGRESS_WORKER_PORT = int(os.environ.get("INGRESS_WORKER_PORT", "9100"))
+INGRESS_FORWARD_TIMEOUT = float(os.environ.get("INGRESS_FORWARD_TIMEOUT", "10"))
+INGRESS_START_TIMEOUT = float(os.environ.get("INGRESS_START_TIMEOUT", "60"))
+BOT_API_BASE_URL = os.environ.get("BOT_API_BASE_URL", "https://api.telegram.org")
+
+forwarded = metrics.Counter(
+    'ingress_updates_total', "Updates by worker and outcome", ['worker', 'outcome']
+)
+forward_latency = metrics.Histogram(
+    'ingress_forward_seconds', "Time for a worker to accept an update",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+relayed = metrics.Counter('ingress_cluster_changes_total', "Changes relayed between workers", ['kind'])
+worker_restarts = metrics.Counter('ingress_worker_restarts_total', "Workers restarted after exiting", ['worker'])
+
+
+class Worker:
+    def __init__(self, index, port, env):
+        self.index = index
+        self.port = port
+        self.env = env
+        self.url = f"http://127.0.0.1:{port}"
+        self.proc = None
+        self.restarts = 0
+
+    def spawn(self):
+        self.proc = subprocess.Popen([sys.executable, os.path.join(HERE, 'main.py')], env=self.env)
+        logger.info("Worker %s started (pid %s, port %s)", self.index, self.proc.pid, self.port)
+
+    @property
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def stop(self):
+        if self.alive:
+            self.proc.send_signal(signal.SIGTERM)
+
+    def wait(self, timeout):
+        try:
+            self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning("Worker %s did not stop in %ss, killing it", self.index, timeout)
+            self.proc.kill()
+            self.proc.wait()
+
+
+class Ingress:
+    """Routes each update to worker `user_id % workers`, one at a time per user.
+
+    Forwarding waits until the worker has queued the update and passes its
+    status back, so a full worker queue (503) or a dead worker makes
+    Telegram retry the update later instead of losing it.
+    """
+
+    def __init__(self, config, token, workers=INGRESS_WORKERS, base_port=INGRESS_WORKER_PORT):
+        self.config = config
+        self.token = token
+        # سر داخلي بين الـ ingress والـ workers، غير سر تيليجرام
+        self.internal_secret = secrets.token_urlsafe(32)
+        self.workers = [
+            Worker(i, base_port + i, self._worker_env(i, workers, base_port + i))
+            for i in range(workers)
+        ]
+        self._locks = {}
+        self._session = None
+        self._runner = None
+        self._supervisor = None
+        self._stopping = False
+
+    def _worker_env(self, index, count, port):
+        env = dict(os.environ)
+        # /active والبث يقرون مستخدمي باقي الـ workers من التخزين، فنكتب أسرع من الافتراضي
+        env.setdefault('USERS_FLUSH_INTERVAL', '5')
+        env.update(
+            BOT_MODE='webhook',
+            PORT=str(port),
+            WEBHOOK_HOST='127.0.0.1',
+            WEBHOOK_PATH=self.config.path,
+            WEBHOOK_SECRET=self.internal_secret,
+            WEBHOOK_REGISTER='0',
+            CLUSTER_SHARD_INDEX=str(index),
+            CLUSTER_SHARD_COUNT=str(count),
+            CLUSTER_INGRESS_URL=f"http://127.0.0.1:{self.config.port}",
+            CLUSTER_SECRET=self.internal_secret,
+            # ملفات JSON تنكتب كاملة من كل عملية، فالمشاركة لازم تكون عبر SQLite
+            STORAGE_BACKEND='sqlite',
+            BROADCAST_JOBS_DIR=os.path.join(os.environ.get("BROADCAST_JOBS_DIR", 'broadcast_jobs'), f"shard-{index}"),
+        )
+        return env
+
+    async def _forward(self, worker, body):
+        started = time.perf_counter()
+        try:
+            async with self._session.post(
+                    worker.url + self.config.path, data=body,
+                    headers={SECRET_HEADER: self.internal_secret, 'Content-Type': 'application/json'}) as resp:
+                status = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            forwarded.inc(worker.index, 'unavailable')
+            return 503
+        forward_latency.observe(time.perf_counter() - started)
+        forwarded.inc(worker.index, 'accepted' if status == 200 else str(status))
+        return status
+
+    async def telegram_update(self, request):
+        if self.config.secret and not hmac.compare_digest(
+                request.headers.get(SECRET_HEADER, ''), self.config.secret):
+            return web.Response(status=403)
+        body = await request.read()
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+        key = cluster.raw_ordering_key(data) if isinstance(data, dict) else None
+        worker = self.workers[cluster.shard_for(key, len(self.workers))]
+        if key is None:
+            return web.Response(status=await self._forward(worker, body))
+        # تحديثات نفس المستخدم توصل للـ worker بنفس ترتيبها
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                status = await self._forward(worker, body)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+        return web.Response(status=status)
+
+    async def cluster_change(self, request):
+        if not hmac.compare_digest(request.headers.get(cluster.CONTROL_HEADER, ''), self.internal_secret):
+            return web.Response(status=403)
+        message = await request.json()
+        relayed.inc(message.get('kind'))
+        body = json.dumps(message)
+        headers = {cluster.CONTROL_HEADER: self.internal_secret, 'Content-Type': 'application/json'}
+
+        async def send(worker):
+            try:
+                async with self._session.post(worker.url + cluster.CONTROL_PATH, data=body, headers=headers) as resp:
+                    return resp.status == 200
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return False
+
+        targets = [w for w in self.workers if w.index != message.get('origin')]
+        results = await asyncio.gather(*(send(w) for w in targets))
+        for worker, ok in zip(targets, results):
+            if not ok:
+                # التغيير محفوظ بالتخزين، فالـ worker يشوفه بعد ما يرجع
+                logger.warning("Worker %s missed a %s change", worker.index, message.get('kind'))
+        return web.Response()
+
+    def report(self):
+        workers = [
+            {'index': w.index, 'pid': w.proc and w.proc.pid, 'alive': w.alive, 'restarts': w.restarts}
+            for w in self.workers
+        ]
+        alive = sum(w['alive'] for w in workers)
+        return {'workers': workers, 'live': True, 'ready': alive == len(workers)}
+
+    async def liveness(self, request):
+        return web.json_response(self.report())
+
+    async def readiness(self, request):
+        report = self.report()
+        return web.json_response(report, status=200 if report['ready'] else 503)
+
+    async def metrics_endpoint(self, request):
+        return web.Response(text=metrics.render(), content_type='text/plain')
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(1)
+            for worker in self.workers:
+                if not worker.alive and not self._stopping:
+                    logger.error("Worker %s exited with %s, restarting", worker.index, worker.proc.returncode)
+                    worker.restarts += 1
+                    worker_restarts.inc(worker.index)
+                    worker.spawn()
+
+    async def _wait_ready(self):
+        deadline = time.monotonic() + INGRESS_START_TIMEOUT
+        pending = list(self.workers)
+        while pending:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"workers {[w.index for w in pending]} did not start")
+            worker = pending[0]
+            if not worker.alive:
+                raise RuntimeError(f"worker {worker.index} exited with {worker.proc.returncode}")
+            try:
+                async with self._session.get(worker.url + '/livez') as resp:
+                    if resp.status == 200:
+                        pending.pop(0)
+                        continue
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+
+    async def _set_webhook(self):
+        params = {'url': self.config.url, 'drop_pending_updates': self.config.drop_pending_updates}
+        if self.config.secret:
+            params['secret_token'] = self.config.secret
+        # allowed_updates ما ينرسل: تيليجرام يحتفظ بآخر قائمة سجلها البوت
+        url = f"{BOT_API_BASE_URL.rstrip('/')}/bot{self.token}/setWebhook"
+        async with self._session.post(url, json=params) as resp:
+            result = await resp.json()
+        if not result.get('ok'):
+            raise RuntimeError(f"setWebhook failed: {result.get('description')}")
+
+    async def start(self):
+        self._session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=INGRESS_FORWARD_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=0),
+        )
+        for worker in self.workers:
+            worker.spawn()
+        await self._wait_ready()
+        self._supervisor = asyncio.get_running_loop().create_task(self._supervise())
+
+        app = web.Application()
+        app.router.add_post(self.config.path, self.telegram_update)
+        app.router.add_post(cluster.CONTROL_PATH, self.cluster_change)
+        app.router.add_get('/', self.liveness)
+        app.router.add_get('/livez', self.liveness)
+        app.router.add_get('/readyz', self.readiness)
+        app.router.add_get('/metrics', self.metrics_endpoint)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.config.host, self.config.port).start()
+        if self.config.register:
+            await self._set_webhook()
+        logger.info("Ingress listening on port %s with %s workers", self.config.port, len(self.workers))
+
+    async def stop(self):
+        self._stopping = True
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+        # نوقف استقبال التحديثات أولاً، بعدين الـ workers يكملون اللي عندهم ويحفظون
+        if self._runner is not None:
+            await self._runner.cleanup()
+        for worker in self.workers:
+            worker.stop()
+        await asyncio.gather(*(asyncio.to_thread(w.wait, 30) for w in self.workers if w.proc))
+        if self._session is not None:
+            await self._session.close()
+
+
+async def serve(ingress):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await ingress.start()
+        await stop.wait()
+    finally:
+        await ingress.stop()
+
+
+def main():
+    token = os.environ.get("BOT_TOKEN")
+    if not token:
+        logger.error("BOT_TOKEN environment variable not set!")
+        return
+    asyncio.run(serve(Ingress(WebhookConfig.from_env(), token)))
+
+
+if __name__ == '__main__':
+    main()
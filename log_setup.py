@@ -0,0 +1,152 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+
+# حقول إضافية نحطها بالـ JSON إذا انمررت بـ extra=
+STRUCTURED_FIELDS = ('user_id', 'username', 'handler', 'state', 'latency_ms', 'path', 'status', 'size', 'startup')
+
+# مستويات افتراضية: httpx يكتب سطر لكل طلب لـ Bot API
+DEFAULT_LEVELS = 'httpx=WARNING,apscheduler=WARNING'
+DEFAULT_SAMPLING = 'bot.latency=0.05'
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    # QueueHandler الأصلي ينسق الرسالة بالـ thread اللي سجلها (الـ event loop)؛
+    # هنا نأجل التنسيق لـ thread الـ listener
+    def prepare(self, record):
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of INFO/DEBUG records per logger prefix; warnings always pass.
+
+    Records logged with extra={'sampled': True} were already drawn by the
+    caller through sampled() and pass as they are.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        # الأطول أولاً حتى يغلب التحديد الأدق
+        self.rates = sorted(rates.items(), key=lambda kv: -len(kv[0]))
+
+    def rate(self, name):
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + '.'):
+                return rate
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or getattr(record, 'sampled', False):
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+_sampling = SamplingFilter({})
+
+
+def sampled(name):
+    """Draws the LOG_SAMPLING sample for logger `name` up front.
+
+    For hot paths: a dropped record then costs one random() call instead
+    of a LogRecord and a trip through the queue handler. Log the kept
+    ones with extra={'sampled': True, ...}.
+    """
+    rate = _sampling.rate(name)
+    return rate >= 1 or random.random() < rate
+
+
+def _parse_pairs(spec):
+    pairs = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = item.partition('=')
+        pairs[name.strip()] = value.strip()
+    return pairs
+
+
+def setup_logging(log_file=None, level=None, log_format=None, levels=None, sampling=None,
+                  max_bytes=10 * 1024 * 1024, backup_count=5):
+    """Routes all logging through a queue drained by a background thread.
+
+    Settings fall back to LOG_LEVEL, LOG_FORMAT (json|text), LOG_FILE,
+    LOG_LEVELS ("name=LEVEL,...") and LOG_SAMPLING ("name=0.1,...").
+    """
+    global _listener, _sampling
+    if _listener is not None:
+        return
+
+    level = level or os.environ.get("LOG_LEVEL", "INFO")
+    log_format = log_format or os.environ.get("LOG_FORMAT", "json")
+    log_file = log_file or os.environ.get("LOG_FILE")
+    levels = levels or os.environ.get("LOG_LEVELS", DEFAULT_LEVELS)
+    sampling = sampling or os.environ.get("LOG_SAMPLING", DEFAULT_SAMPLING)
+
+    if log_format == 'json':
+        formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+
+    if log_file:
+        output = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+    else:
+        output = logging.StreamHandler()
+    output.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    handler = LazyQueueHandler(log_queue)
+    _sampling = SamplingFilter({k: float(v) for k, v in _parse_pairs(sampling).items()})
+    handler.addFilter(_sampling)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name, name_level in _parse_pairs(levels).items():
+        logging.getLogger(name).setLevel(name_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def _restart_listener():
+    # thread الـ listener ما ينتقل للعملية الابن بعد fork، فنشغل واحد جديد على نفس الطابور
+    global _listener
+    if _listener is not None:
+        old = _listener
+        _listener = logging.handlers.QueueListener(old.queue, *old.handlers,
+                                                   respect_handler_level=old.respect_handler_level)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listener)
@@ -1,26 +1,46 @@
+# أول import: مراحل الإقلاع تنقاس من هنا (شوف startup.py)
+from startup import profile as startup_profile
+
+import time
 import logging
 import os
-import json
 import asyncio
-from datetime import datetime, timedelta
 
 from telegram import Bot, Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
     ApplicationBuilder,
+    ApplicationHandlerStop,
     CommandHandler,
     MessageHandler,
     filters,
     ContextTypes,
-    ConversationHandler
+    ConversationHandler,
+    TypeHandler
 )
 from telegram.ext.filters import MessageFilter 
 
-# Logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from activity_store import ActivityStore
+from admin_notify import AdminNotifier
+from bot_request import InstrumentedRequest, mean_latency
+from broadcast import (
+    JOBS_DIR, JobManager, api_method, estimate_seconds, format_duration, payload_from_message,
 )
+from log_setup import setup_logging
+from persistence import SQLitePersistence
+from storage import open_storage
+from throttle import FloodControl, auto_mutes_total
+from update_processor import PerUserUpdateProcessor
+from health import monitor as health_monitor
+import cluster
+import metrics
+import calculator
+import segments
+
+# Logging: طابور + thread منفصل، JSON افتراضياً (شوف log_setup.py للإعدادات)
+setup_logging()
 logger = logging.getLogger(__name__)
+handler_log = logging.getLogger('bot.handlers')
+startup_profile.mark('imports')
 
 # States
 CHOOSING_OPTION, GET_THEORETICAL_CREDIT, GET_PRACTICAL_CREDIT, SEND_MESSAGE = range(4)
@@ -33,81 +53,146 @@ HEY_WAITING_FOR_MESSAGE = 999
 SPECIAL_USER_ID = 77655677655
 AUTHORIZED_USER_ID = 6177929931
 
-# JSON files
-MUTED_USERS_FILE = 'muted_users.json'
-USERS_FILE = 'users.json'
-WELCOME_MSGS_FILE = 'welcome_msgs.json'
+# users.json ينكتب بالخلفية: كل USERS_FLUSH_INTERVAL ثانية أو بعد USERS_FLUSH_THRESHOLD تحديث
+USERS_FLUSH_INTERVAL = float(os.environ.get("USERS_FLUSH_INTERVAL", "30"))
+USERS_FLUSH_THRESHOLD = int(os.environ.get("USERS_FLUSH_THRESHOLD", "1000"))
+
+# BOT_MODE=webhook يشغل خادم aiohttp واحد (تحديثات + صحة + metrics) بدل polling
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+BOT_API_BASE_URL = os.environ.get("BOT_API_BASE_URL")
+
+# إشعارات المشرف: ملخص المكتومين كل ADMIN_DIGEST_WINDOW ثانية، والرسائل بعد ADMIN_URGENT_DELAY
+ADMIN_DIGEST_WINDOW = float(os.environ.get("ADMIN_DIGEST_WINDOW", "300"))
+ADMIN_URGENT_DELAY = float(os.environ.get("ADMIN_URGENT_DELAY", "2"))
+
+# حد الرسائل لكل مستخدم: THROTTLE_RATE رسالة بالثانية مع دفعة THROTTLE_BURST
+# AUTO_MUTE_AFTER > 0 يكتم تلقائياً بعد هذا العدد من الرسائل المرفوضة خلال AUTO_MUTE_WINDOW ثانية
+THROTTLE_RATE = float(os.environ.get("THROTTLE_RATE", "1"))
+THROTTLE_BURST = int(os.environ.get("THROTTLE_BURST", "5"))
+AUTO_MUTE_AFTER = int(os.environ.get("AUTO_MUTE_AFTER", "0"))
+AUTO_MUTE_WINDOW = float(os.environ.get("AUTO_MUTE_WINDOW", "60"))
+
+# حالة المحادثات و user_data تنحفظ بـ PERSISTENCE_FILE كل PERSISTENCE_INTERVAL ثانية (فارغ = بدون حفظ)
+PERSISTENCE_FILE = os.environ.get("PERSISTENCE_FILE", "state.db")
+PERSISTENCE_INTERVAL = float(os.environ.get("PERSISTENCE_INTERVAL", "5"))
+# DROP_PENDING_UPDATES=0 يعالج التحديثات اللي وصلت والبوت طافي بدل ما يرميها
+DROP_PENDING_UPDATES = os.environ.get("DROP_PENDING_UPDATES", "1") != "0"
+
+# عدد التحديثات اللي تنعالج سوا؛ تحديثات نفس المستخدم تبقى بالترتيب. 1 = بالتسلسل
+UPDATE_WORKERS = int(os.environ.get("UPDATE_WORKERS", "32"))
+
+# البث: عدد الإرسالات المتزامنة والحد الأعلى للرسائل بالثانية
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", "16"))
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", "25"))
+# كل worker خلف ingress.py له مجلد بثوث خاص حتى ما يستأنف بث غيره
+BROADCAST_JOBS_DIR = os.environ.get("BROADCAST_JOBS_DIR", JOBS_DIR)
+
+# USERS_LAZY_LOAD=1: سجل المستخدمين ينقرا بالخلفية بعد الإقلاع، والبوت يجاوب بهالوقت
+USERS_LAZY_LOAD = os.environ.get("USERS_LAZY_LOAD", "1") != "0"
 
 MAIN_MENU_KEYBOARD = [
     ['حساب غياب النظري', 'حساب غياب العملي'],
     ['ارسل رسالة لصاحب البوت', 'حساب درجتك بلبلوك']
 ]
+BACK_TO_MENU = 'العودة للقائمة الرئيسية'
+LOOKUP_TABLE = 'جدول'
+MENU_PROMPT = "اختر من القائمة:"
+
+# الكيبوردات ثابتة، فنبنيها مرة وحدة بدل كل رسالة
+MAIN_MENU_MARKUP = ReplyKeyboardMarkup(MAIN_MENU_KEYBOARD, one_time_keyboard=True, resize_keyboard=True)
+BACK_MARKUP = ReplyKeyboardMarkup([[BACK_TO_MENU]], one_time_keyboard=True, resize_keyboard=True)
+
+# STORAGE_BACKEND=json (الافتراضي) أو sqlite
+storage = open_storage()
+muted_users = storage.load_muted()
+activity_store = ActivityStore(
+    storage,
+    flush_interval=USERS_FLUSH_INTERVAL,
+    flush_threshold=USERS_FLUSH_THRESHOLD,
+    lazy=USERS_LAZY_LOAD,
+)
+known_users = activity_store.users
 
-def load_override_welcomes():
-    if os.path.exists(WELCOME_MSGS_FILE):
-        with open(WELCOME_MSGS_FILE, 'r', encoding='utf-8') as f:
-            try:
-                data = json.load(f)
-                return {int(k): v for k, v in data.items()}
-            except json.JSONDecodeError:
-                return {}
-    return {}
-
-def save_override_welcomes(mapping):
-    with open(WELCOME_MSGS_FILE, 'w', encoding='utf-8') as f:
-        json.dump({str(k): v for k, v in mapping.items()}, f, ensure_ascii=False)
-
-def load_muted_users():
-    if os.path.exists(MUTED_USERS_FILE):
-        with open(MUTED_USERS_FILE, 'r', encoding='utf-8') as f:
-            try:
-                return set(json.load(f))
-            except json.JSONDecodeError:
-                return set()
-    return set()
-
-def save_muted_users(muted):
-    with open(MUTED_USERS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(list(muted), f)
-
-def load_users():
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'r', encoding='utf-8') as f:
-            try:
-                data = json.load(f)
-                return {int(k): v for k, v in data.items()}
-            except (json.JSONDecodeError, ValueError):
-                return {}
-    return {}
-
-def save_users(users_dict):
-    with open(USERS_FILE, 'w', encoding='utf-8') as f:
-        json.dump({str(k): v for k, v in users_dict.items()}, f)
-
-muted_users = load_muted_users()
-known_users = load_users()
-override_welcome_messages = load_override_welcomes()
+metrics.Gauge('bot_known_users', "Users in the registry", lambda: len(known_users))
+metrics.Gauge('bot_users_dirty', "Activity updates not yet flushed", lambda: activity_store.dirty)
+metrics.Gauge(
+    'bot_users_flushes_total', "Activity store flushes",
+    lambda: activity_store.flush_count, 'counter',
+)
+metrics.Gauge(
+    'bot_users_flush_bytes_total', "Bytes written by activity store flushes",
+    lambda: activity_store.bytes_written, 'counter',
+)
 
-def log_user_activity(user_id):
-    known_users[user_id] = datetime.now().isoformat()
-    save_users(known_users)
+override_welcome_messages = storage.load_welcomes()
 
-async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "اختر من القائمة:",
-        reply_markup=ReplyKeyboardMarkup(
-            MAIN_MENU_KEYBOARD,
-            one_time_keyboard=True,
-            resize_keyboard=True
+
+def _apply_muted(user_id, muted):
+    if muted:
+        muted_users.add(user_id)
+    else:
+        muted_users.discard(user_id)
+
+
+def _apply_welcome(user_id, text):
+    if text is None:
+        override_welcome_messages.pop(user_id, None)
+    else:
+        override_welcome_messages[user_id] = text
+
+
+def set_muted(user_id, muted):
+    _apply_muted(user_id, muted)
+    storage.set_muted(user_id, muted)
+    cluster.publish('muted', user_id, muted)
+
+
+def set_welcome(user_id, text):
+    _apply_welcome(user_id, text)
+    storage.set_welcome(user_id, text)
+    cluster.publish('welcome', user_id, text)
+
+
+# تغييرات workers ثانية: التخزين المشترك انكتب عندهم، فبس نحدث الذاكرة
+cluster.on_change('muted', _apply_muted)
+cluster.on_change('welcome', _apply_welcome)
+
+# المكتومين والترحيبات صغيرة ولازمة لأول رد، فتنقرا هنا؛ المستخدمين بالخلفية
+startup_profile.mark('state')
+
+flood_control = FloodControl(
+    rate=THROTTLE_RATE,
+    burst=THROTTLE_BURST,
+    mute_after=AUTO_MUTE_AFTER,
+    mute_window=AUTO_MUTE_WINDOW,
+)
+
+# يتهيأون بـ post_init لأنهم يحتاجون البوت
+job_manager = None
+admin_notifier = None
+
+def log_input(handler, user, text, state=None):
+    # بدون f-string: التنسيق يصير بـ thread الـ logging، وبس إذا المستوى مفعّل
+    if handler_log.isEnabledFor(logging.INFO):
+        handler_log.info(
+            "%s: %s", handler, text,
+            extra={'user_id': user.id, 'username': user.username, 'handler': handler, 'state': state},
         )
-    )
+
+def log_user_activity(user_id):
+    activity_store.touch(user_id)
+
+async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, text=None):
+    # النتيجة والقائمة برسالة وحدة: طلب واحد لـ Bot API بدل اثنين
+    body = f"{text}\n\n{MENU_PROMPT}" if text else MENU_PROMPT
+    await update.message.reply_text(body, reply_markup=MAIN_MENU_MARKUP)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user = update.effective_user
     user_id = user.id
 
     log_user_activity(user_id)
-    logger.info(f"User {user.username or user_id} used /start - Message: {update.message.text}")
+    log_input('start', user, update.message.text)
 
     if user_id in muted_users:
         await update.message.reply_text("⚠️ لقد تم كتمك من استخدام هذا البوت.")
@@ -124,9 +209,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             "اهلا وسهلا!"
         )
 
-    await update.message.reply_text(welcome_text)
-    await asyncio.sleep(0.3)
-    await show_main_menu(update, context)
+    await show_main_menu(update, context, welcome_text)
     return CHOOSING_OPTION
 
 async def choice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -134,42 +217,46 @@ async def choice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     log_user_activity(user.id)
     text = (update.message.text or "").strip()
     
-    logger.info(f"User {user.username or user.id} selected: {text}")
+    log_input('choice', user, text, CHOOSING_OPTION)
 
     if text == 'حساب غياب النظري':
         await update.message.reply_text(
-            "اكتب رقم الكردت لمادة النظري (مثال: 3.0).\n\n"
+            "اكتب رقم الكردت لمادة النظري (مثال: 3.0).\n"
+            "لعدة مواد اكتبهم برسالة وحدة: 3, 2, 1.5 أو كل مادة بسطر.\n"
+            "اكتب 'جدول' لجدول القيم الشائعة.\n\n"
             "أو اختر 'العودة للقائمة الرئيسية':",
-            reply_markup=ReplyKeyboardMarkup([['العودة للقائمة الرئيسية']], True, True)
+            reply_markup=BACK_MARKUP
         )
         return GET_THEORETICAL_CREDIT
 
     elif text == 'حساب غياب العملي':
         await update.message.reply_text(
-            "اكتب رقم الكردت لمادة العملي (مثال: 1.5).\n\n"
+            "اكتب رقم الكردت لمادة العملي (مثال: 1.5).\n"
+            "لعدة مواد اكتبهم برسالة وحدة: 1, 1.5 أو كل مادة بسطر.\n"
+            "اكتب 'جدول' لجدول القيم الشائعة.\n\n"
             "أو اختر 'العودة للقائمة الرئيسية':",
-            reply_markup=ReplyKeyboardMarkup([['العودة للقائمة الرئيسية']], True, True)
+            reply_markup=BACK_MARKUP
         )
         return GET_PRACTICAL_CREDIT
 
     elif text == 'ارسل رسالة لصاحب البوت':
         await update.message.reply_text(
             "يمكنك إرسال رسالتك الآن، أو اختر 'العودة للقائمة الرئيسية':",
-            reply_markup=ReplyKeyboardMarkup([['العودة للقائمة الرئيسية']], True, True)
+            reply_markup=BACK_MARKUP
         )
         return SEND_MESSAGE
 
     elif text == 'حساب درجتك بلبلوك':
         await update.message.reply_text(
-            "شكد المادة عليها بلبلوك؟ (اكتب رقم فقط)\n\n"
+            "شكد المادة عليها بلبلوك؟ (اكتب رقم فقط)\n"
+            "أو اكتب الثلاثة بسطر وحد: عليها، الكلية، خذيت (مثال: 40 100 80)، ولعدة مواد كل مادة بسطر.\n\n"
             "أو اختر 'العودة للقائمة الرئيسية':",
-            reply_markup=ReplyKeyboardMarkup([['العودة للقائمة الرئيسية']], True, True)
+            reply_markup=BACK_MARKUP
         )
         return BLOK_MATERIA
 
     else:
-        await update.message.reply_text("خيار غير معروف!")
-        await show_main_menu(update, context)
+        await show_main_menu(update, context, "خيار غير معروف!")
         return CHOOSING_OPTION
 
 async def theoretical_credit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -177,21 +264,27 @@ async def theoretical_credit(update: Update, context: ContextTypes.DEFAULT_TYPE)
     log_user_activity(user.id)
     text = (update.message.text or "").strip()
     
-    logger.info(f"User {user.username or user.id} entered theoretical: {text}")
+    log_input('theoretical_credit', user, text, GET_THEORETICAL_CREDIT)
 
-    if text == 'العودة للقائمة الرئيسية':
+    if text == BACK_TO_MENU:
         await show_main_menu(update, context)
         return CHOOSING_OPTION
 
+    if text == LOOKUP_TABLE:
+        await update.message.reply_text(calculator.lookup_table('theoretical'), reply_markup=BACK_MARKUP)
+        return GET_THEORETICAL_CREDIT
+
     try:
-        credit = float(text)
-        result = credit * 8 * 0.2352941176
-        await update.message.reply_text(f"غيابك للنظري هو: {result:.2f}")
+        # رقم واحد أو عدة مواد، والنتائج كلها برد واحد
+        result = calculator.absence_reply('theoretical', text)
+    except OverflowError:
+        await update.message.reply_text(f"الحد الأقصى {calculator.MAX_BATCH} مادة بالرسالة الوحدة.")
+        return GET_THEORETICAL_CREDIT
     except ValueError:
         await update.message.reply_text("الرجاء إدخال رقم صالح.")
         return GET_THEORETICAL_CREDIT
 
-    await show_main_menu(update, context)
+    await show_main_menu(update, context, result)
     return CHOOSING_OPTION
 
 async def practical_credit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -199,21 +292,27 @@ async def practical_credit(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     log_user_activity(user.id)
     text = (update.message.text or "").strip()
     
-    logger.info(f"User {user.username or user.id} entered practical: {text}")
+    log_input('practical_credit', user, text, GET_PRACTICAL_CREDIT)
 
-    if text == 'العودة للقائمة الرئيسية':
+    if text == BACK_TO_MENU:
         await show_main_menu(update, context)
         return CHOOSING_OPTION
 
+    if text == LOOKUP_TABLE:
+        await update.message.reply_text(calculator.lookup_table('practical'), reply_markup=BACK_MARKUP)
+        return GET_PRACTICAL_CREDIT
+
     try:
-        credit = float(text)
-        result = credit * 8 * 0.1176470588
-        await update.message.reply_text(f"غيابك للعملي هو: {result:.2f}")
+        # رقم واحد أو عدة مواد، والنتائج كلها برد واحد
+        result = calculator.absence_reply('practical', text)
+    except OverflowError:
+        await update.message.reply_text(f"الحد الأقصى {calculator.MAX_BATCH} مادة بالرسالة الوحدة.")
+        return GET_PRACTICAL_CREDIT
     except ValueError:
         await update.message.reply_text("الرجاء إدخال رقم صالح.")
         return GET_PRACTICAL_CREDIT
 
-    await show_main_menu(update, context)
+    await show_main_menu(update, context, result)
     return CHOOSING_OPTION
 
 async def blok_materia(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -221,17 +320,29 @@ async def blok_materia(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     log_user_activity(user.id)
     text = (update.message.text or "").strip()
     
-    logger.info(f"User {user.username or user.id} entered blok materia: {text}")
+    log_input('blok_materia', user, text, BLOK_MATERIA)
 
-    if text == 'العودة للقائمة الرئيسية':
+    if text == BACK_TO_MENU:
         await show_main_menu(update, context)
         return CHOOSING_OPTION
 
+    try:
+        # الثلاثة أرقام برسالة وحدة (أو عدة مواد) تنحسب مباشرة
+        result = calculator.blok_batch_reply(text)
+    except OverflowError:
+        await update.message.reply_text(f"الحد الأقصى {calculator.MAX_BATCH} مادة بالرسالة الوحدة.")
+        return BLOK_MATERIA
+    except ValueError:
+        result = None
+    if result is not None:
+        await show_main_menu(update, context, result)
+        return CHOOSING_OPTION
+
     try:
         context.user_data['blok_materia'] = float(text)
         await update.message.reply_text(
             "شكد الدرجة الكلية لهذي المادة؟ (اكتب رقم فقط)",
-            reply_markup=ReplyKeyboardMarkup([['العودة للقائمة الرئيسية']], True, True)
+            reply_markup=BACK_MARKUP
         )
         return BLOK_TOTAL
     except ValueError:
@@ -243,17 +354,21 @@ async def blok_total(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     log_user_activity(user.id)
     text = (update.message.text or "").strip()
     
-    logger.info(f"User {user.username or user.id} entered blok total: {text}")
+    log_input('blok_total', user, text, BLOK_TOTAL)
 
-    if text == 'العودة للقائمة الرئيسية':
+    if text == BACK_TO_MENU:
         await show_main_menu(update, context)
         return CHOOSING_OPTION
 
     try:
-        context.user_data['blok_total'] = float(text)
+        total = float(text)
+        # blok_grade يرفض الصفر، فنرفضه هنا حتى ما ينرفض رقم "شكد خذيت" بعدين
+        if total <= 0:
+            raise ValueError(total)
+        context.user_data['blok_total'] = total
         await update.message.reply_text(
             "شكد خذيت؟ (اكتب رقم فقط)",
-            reply_markup=ReplyKeyboardMarkup([['العودة للقائمة الرئيسية']], True, True)
+            reply_markup=BACK_MARKUP
         )
         return BLOK_TAKEN
     except ValueError:
@@ -265,9 +380,9 @@ async def blok_taken(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     log_user_activity(user.id)
     text = (update.message.text or "").strip()
     
-    logger.info(f"User {user.username or user.id} entered blok taken: {text}")
+    log_input('blok_taken', user, text, BLOK_TAKEN)
 
-    if text == 'العودة للقائمة الرئيسية':
+    if text == BACK_TO_MENU:
         await show_main_menu(update, context)
         return CHOOSING_OPTION
 
@@ -275,13 +390,12 @@ async def blok_taken(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         taken = float(text)
         materia_val = context.user_data.get('blok_materia', 0)
         total_val = context.user_data.get('blok_total', 1)
-        result = (materia_val * taken) / total_val
-        await update.message.reply_text(f"درجتك بلبلوك هي: {result:.2f}")
+        result = calculator.blok_grade(materia_val, total_val, taken)
     except ValueError:
         await update.message.reply_text("الرجاء إدخال رقم صالح.")
         return BLOK_TAKEN
 
-    await show_main_menu(update, context)
+    await show_main_menu(update, context, f"درجتك بلبلوك هي: {result:.2f}")
     return CHOOSING_OPTION
 
 async def send_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -289,27 +403,20 @@ async def send_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     log_user_activity(user.id)
     text = (update.message.text or "").strip()
     
-    logger.info(f"User {user.username or user.id} sent message: {text}")
+    log_input('send_message', user, text, SEND_MESSAGE)
 
-    if text == 'العودة للقائمة الرئيسية':
+    if text == BACK_TO_MENU:
         await show_main_menu(update, context)
         return CHOOSING_OPTION
 
-    user_id = user.id
-    username = user.username or f"ID {user_id}"
-
     if text:
-        try:
-            formatted = f"رسالة من @{username} (ID: {user_id}):\n\n{text}"
-            await context.bot.send_message(chat_id=AUTHORIZED_USER_ID, text=formatted)
-            await update.message.reply_text("تم إرسال الرسالة بنجاح.")
-        except Exception as e:
-            logger.error(f"Failed to forward message: {e}")
-            await update.message.reply_text("حصل خطأ أثناء إرسال الرسالة. حاول مرة أخرى.")
+        # تنرسل للمشرف خلال ثواني مع أي رسائل ثانية وصلت بنفس الوقت
+        admin_notifier.forward(user, text)
+        reply = "تم إرسال الرسالة بنجاح."
     else:
-        await update.message.reply_text("لم يتم العثور على نص للرسالة.")
+        reply = "لم يتم العثور على نص للرسالة."
 
-    await show_main_menu(update, context)
+    await show_main_menu(update, context, reply)
     return CHOOSING_OPTION
 
 # —————— أوامر المشرف الإضافية ——————
@@ -333,8 +440,7 @@ async def hey_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
 
 async def hey_message_received(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     target = context.user_data.get('hey_target')
-    override_welcome_messages[target] = update.message.text or ""
-    save_override_welcomes(override_welcome_messages)
+    set_welcome(target, update.message.text or "")
     await update.message.reply_text(f"✔ تم تعيين الترحيب للمستخدم {target}.")
     return ConversationHandler.END
 
@@ -363,7 +469,7 @@ async def user_m_message_received(update: Update, context: ContextTypes.DEFAULT_
             await context.bot.send_message(chat_id=target, text=text)
             await update.message.reply_text(f"✔ تم إرسال الرسالة إلى {target}.")
         except Exception as e:
-            logger.error(e)
+            logger.error("Failed to send message to %s: %s", target, e)
             await update.message.reply_text("❌ حدث خطأ أثناء الإرسال.")
     else:
         await update.message.reply_text("❌ لا توجد رسالة.")
@@ -373,60 +479,152 @@ async def broadcast_ask_command(update: Update, context: ContextTypes.DEFAULT_TY
     if update.effective_user.id != AUTHORIZED_USER_ID:
         await update.message.reply_text("❌ أنت غير مصرح لك.")
         return ConversationHandler.END
-    await update.message.reply_text("أرسل محتوى البث:")
+    try:
+        context.user_data['broadcast_segment'] = segments.parse_segment(context.args or [])
+    except ValueError:
+        await update.message.reply_text(segments.USAGE)
+        return ConversationHandler.END
+    await update.message.reply_text("أرسل محتوى البث (نص، صورة، ملف أو فيديو مع وصف):")
     return BROADCAST_ASK_MESSAGE
 
+async def broadcast_audience(segment):
+    if cluster.enabled:
+        # كل worker يكتب مستخدميه بس؛ نجيب الباقين من التخزين المشترك
+        await activity_store.refresh()
+    else:
+        await activity_store.wait_loaded()
+    return segments.resolve(segment, known_users, muted_users)
+
+# أسماء أنواع الوسائط بالمعاينة
+MEDIA_LABELS = {'photo': 'صورة', 'animation': 'صورة متحركة', 'video': 'فيديو', 'document': 'ملف'}
+
 async def broadcast_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    context.user_data['broadcast_message'] = update.message.text or ""
-    await update.message.reply_text("تأكيد الإرسال إلى الجميع؟ (نعم/لا)")
+    payload = payload_from_message(update.message)
+    if payload is None:
+        await update.message.reply_text("❌ نوع الرسالة غير مدعوم. أرسل نص أو صورة أو ملف أو فيديو:")
+        return BROADCAST_ASK_MESSAGE
+    context.user_data['broadcast_payload'] = payload
+    segment = context.user_data.get('broadcast_segment') or {}
+    audience = await broadcast_audience(segment)
+    seconds = estimate_seconds(
+        len(audience), BROADCAST_RATE, BROADCAST_CONCURRENCY, mean_latency(api_method(payload)),
+    )
+    await update.message.reply_text(
+        f"الجمهور: {segments.describe(segment)}\n"
+        f"• المحتوى: {MEDIA_LABELS.get(payload.get('kind'), 'نص')}\n"
+        f"• عدد المستلمين: {len(audience)}\n"
+        f"• الوقت المتوقع: {format_duration(seconds)}\n"
+        "تأكيد الإرسال؟ (نعم/لا)"
+    )
     return BROADCAST_CONFIRMATION
 
 async def broadcast_execute(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     resp = (update.message.text or "").strip().lower()
     if resp in ['نعم', 'yes', 'y']:
-        msg = context.user_data.get('broadcast_message', '')
-        count = 0
-        for uid in known_users.keys():
-            try:
-                await context.bot.send_message(chat_id=uid, text=msg)
-                count += 1
-            except:
-                pass
-        await update.message.reply_text(f"✔ تم الإرسال إلى {count} مستخدمين.")
+        payload = context.user_data.get('broadcast_payload') or {'text': ''}
+        # تنحسب من جديد: ممكن مستخدمين جدد وصلوا من وقت المعاينة
+        audience = await broadcast_audience(context.user_data.get('broadcast_segment') or {})
+        if not audience:
+            await update.message.reply_text("❌ ما فيه مستخدمين بهالفئة.")
+            return ConversationHandler.END
+        job = job_manager.create(audience, payload, update.effective_chat.id)
+        # البث يشتغل بالخلفية حتى ما تنقفل محادثة المشرف
+        job_manager.start(job)
+        await update.message.reply_text(f"🚀 بدأ البث {job.job_id} إلى {job.total} مستخدم.")
     else:
         await update.message.reply_text("❌ تم الإلغاء.")
     return ConversationHandler.END
 
-async def active_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def jobs_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.effective_user.id != AUTHORIZED_USER_ID:
         await update.message.reply_text("❌ ليس لديك صلاحية.")
         return
-    total_users = len(known_users)
-    now = datetime.now()
-    daily_active = sum(
-        1 for t in known_users.values()
-        if (now - datetime.fromisoformat(t)) < timedelta(hours=24)
-    )
+    if not job_manager.jobs:
+        await update.message.reply_text("لا توجد عمليات بث.")
+        return
     await update.message.reply_text(
-        f"📊 إحصائيات البوت:\n\n"
-        f"• إجمالي المستخدمين: {total_users}\n"
-        f"• المستخدمين النشطين اليوم: {daily_active}"
+        "📤 عمليات البث:\n" + "\n".join(job.describe() for job in job_manager.jobs.values())
     )
 
+async def _job_from_args(update: Update, context: ContextTypes.DEFAULT_TYPE, usage):
+    if update.effective_user.id != AUTHORIZED_USER_ID:
+        await update.message.reply_text("❌ ليس لديك صلاحية.")
+        return None
+    if not context.args:
+        await update.message.reply_text(usage)
+        return None
+    job = job_manager.jobs.get(context.args[0])
+    if job is None:
+        await update.message.reply_text("❌ لا يوجد بث بهذا المعرف.")
+    return job
+
+async def job_pause_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    job = await _job_from_args(update, context, "استخدام: /job_pause <id>")
+    if job:
+        job_manager.pause(job)
+        await update.message.reply_text(f"⏸ {job.describe()}")
+
+async def job_resume_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    job = await _job_from_args(update, context, "استخدام: /job_resume <id>")
+    if not job:
+        return
+    if job.status != 'paused' or not job_manager.start(job):
+        await update.message.reply_text(f"❌ لا يمكن استئناف الآن: {job.describe()}")
+        return
+    await update.message.reply_text(f"▶️ {job.describe()}")
+
+async def job_cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    job = await _job_from_args(update, context, "استخدام: /job_cancel <id>")
+    if job:
+        job_manager.cancel(job)
+        await update.message.reply_text(f"✖ {job.describe()}")
+
+async def active_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_user.id != AUTHORIZED_USER_ID:
+        await update.message.reply_text("❌ ليس لديك صلاحية.")
+        return
+    if cluster.enabled:
+        await activity_store.refresh()
+    else:
+        await activity_store.wait_loaded()
+    total_users = len(known_users)
+    lines = [
+        "📊 إحصائيات البوت:\n",
+        f"• إجمالي المستخدمين: {total_users}",
+        f"• آخر ساعة: {activity_store.active_count(1)}",
+        f"• المستخدمين النشطين اليوم: {activity_store.active_count(24)}",
+        f"• آخر 7 أيام: {activity_store.active_count(24 * 7)}",
+        f"• آخر 30 يوم: {activity_store.active_count(24 * 30)}",
+        f"• رسائل مرفوضة (flood): {flood_control.shed}",
+    ]
+    # /active <N> يعطي عدد النشطين بآخر N ساعة
+    if context.args:
+        try:
+            hours = int(context.args[0])
+            if hours > 0:
+                lines.append(f"• آخر {hours} ساعة: {activity_store.active_count(hours)}")
+        except ValueError:
+            pass
+    await update.message.reply_text("\n".join(lines))
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
     if user_id == AUTHORIZED_USER_ID:
         admin_help_text = (
             "🚀 أوامر المشرف:\n\n"
             "/help - إظهار هذه القائمة\n"
-            "/active - إظهار إحصائيات الاستخدام\n"
+            "/active [hours] - إظهار إحصائيات الاستخدام\n"
             "/muteid <userid> - كتم مستخدم\n"
             "/unmuteid <userid> - إلغاء كتم\n"
             "/mutelist - عرض المكتومين\n"
             "/user_m <userid> - إرسال رسالة لمستخدم\n"
             "/hey <userid> - تعيين ترحيب مخصص\n"
             "/hey_r <userid> - حذف ترحيب مخصص\n"
-            "/new - بث رسالة للجميع\n"
+            "/new [active <أيام>] [unmuted] [ids <ids>] - بث رسالة للجميع أو لفئة\n"
+            "/jobs - عرض عمليات البث\n"
+            "/job_pause <id> - إيقاف بث مؤقتاً\n"
+            "/job_resume <id> - استئناف بث\n"
+            "/job_cancel <id> - إلغاء بث\n"
             "/cancel - إلغاء العملية"
         )
         await update.message.reply_text(admin_help_text)
@@ -458,8 +656,7 @@ async def muteid_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     try:
         uid = int(args[0])
-        muted_users.add(uid)
-        save_muted_users(muted_users)
+        set_muted(uid, True)
         await update.message.reply_text(f"✔ تم كتم {uid}.")
     except:
         await update.message.reply_text("❌ خطأ.")
@@ -474,8 +671,7 @@ async def unmuteid_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     try:
         uid = int(args[0])
-        muted_users.discard(uid)
-        save_muted_users(muted_users)
+        set_muted(uid, False)
         await update.message.reply_text(f"✔ تم إلغاء كتم {uid}.")
     except:
         await update.message.reply_text("❌ خطأ.")
@@ -490,27 +686,45 @@ async def hey_remove_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     try:
         uid = int(args[0])
-        override_welcome_messages.pop(uid, None)
-        save_override_welcomes(override_welcome_messages)
+        set_welcome(uid, None)
         await update.message.reply_text(f"✔ تم حذف الترحيب للمستخدم {uid}.")
     except:
         await update.message.reply_text("❌ خطأ.")
 
+# time.monotonic() لآخر تحديث بدأت معالجته، لـ /readyz لما ما فيه PerUserUpdateProcessor
+last_update_at = None
+
+async def note_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    global last_update_at
+    startup_profile.mark('first_update')
+    last_update_at = time.monotonic()
+
+async def throttle_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user = update.effective_user
+    if user is None or user.id == AUTHORIZED_USER_ID:
+        return
+    if flood_control.allow(user.id):
+        return
+    first, should_mute = flood_control.record_shed(user.id)
+    if user.id in muted_users:
+        # المكتوم يتحدد مثل غيره بس بصمت: لا تحذير ولا رد "أنت مكتوم" ولا سطر بالملخص
+        raise ApplicationHandlerStop
+    if should_mute:
+        set_muted(user.id, True)
+        auto_mutes_total.inc()
+        logger.warning("Auto-muted %s for flooding", user.id)
+    elif first and update.effective_message:
+        await update.effective_message.reply_text("⚠️ رسائل كثيرة، انتظر قليلاً ثم حاول مرة أخرى.")
+    # ما نكمل لأي handler ثاني
+    raise ApplicationHandlerStop
+
 class MuteFilter(MessageFilter):
     def filter(self, message):
         return message.from_user and (message.from_user.id in muted_users)
 
 async def handle_muted(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    note = (
-        f"⚠️ Attempt by muted user:\n"
-        f"• ID: {user.id}\n"
-        f"• Username: @{user.username or 'N/A'}"
-    )
-    try:
-        await context.bot.send_message(chat_id=AUTHORIZED_USER_ID, text=note)
-    except:
-        pass
+    # المحاولات تتجمع بملخص واحد كل ADMIN_DIGEST_WINDOW ثانية
+    admin_notifier.muted_attempt(update.effective_user)
     await update.message.reply_text("⚠️ أنت مكتوم ولا يمكنك استخدام البوت.")
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -520,20 +734,100 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 async def default_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text("لم أفهم رسالتك، استخدم الأزرار أو اكتب /start")
 
+errors_total = metrics.Counter('bot_errors_total', "Errors reaching error_handler", ['type'])
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    errors_total.inc(type(context.error).__name__)
     logger.error("Exception occurred:", exc_info=context.error)
     if isinstance(update, Update) and update.effective_message:
         await update.effective_message.reply_text("حدث خطأ غير متوقع. يرجى المحاولة لاحقًا.")
 
-def main():
-    BOT_TOKEN = os.environ.get("BOT_TOKEN")
-    if not BOT_TOKEN:
-        logger.error("BOT_TOKEN environment variable not set!")
-        return
+async def post_init(application) -> None:
+    global job_manager, admin_notifier
+    activity_store.start()
+    health_monitor.start()
+    admin_notifier = AdminNotifier(
+        application.bot,
+        AUTHORIZED_USER_ID,
+        window=ADMIN_DIGEST_WINDOW,
+        urgent_delay=ADMIN_URGENT_DELAY,
+    )
+    admin_notifier.start()
+    job_manager = JobManager(
+        application.bot,
+        jobs_dir=BROADCAST_JOBS_DIR,
+        concurrency=BROADCAST_CONCURRENCY,
+        rate=BROADCAST_RATE,
+        on_gone=activity_store.discard,
+    )
+    job_manager.resume_all()
+    startup_profile.mark('initialize')
+    startup_profile.log("Ready")
+
+async def post_stop(application) -> None:
+    # البثوث الشغالة تتوقف وتنحفظ، وتكمل بعد إعادة التشغيل
+    await job_manager.shutdown()
+    await admin_notifier.stop()
+
+async def post_shutdown(application) -> None:
+    await health_monitor.stop()
+    await activity_store.stop()
+    logger.info("Activity store flushed on shutdown: %s", activity_store.stats())
+    storage.close()
+
+def build_application(token, webhook_mode=False):
+    builder = ApplicationBuilder() \
+        .token(token) \
+        .post_init(post_init) \
+        .post_stop(post_stop) \
+        .post_shutdown(post_shutdown)
+    # BOT_API_BASE_URL يسمح بتوجيه البوت لخادم تيليجرام وهمي بالاختبارات
+    if BOT_API_BASE_URL:
+        builder = builder.base_url(BOT_API_BASE_URL.rstrip('/') + '/bot')
+    # كل طلب لـ Bot API ينحسب وينقاس زمنه بـ /metrics
+    builder = builder.request(InstrumentedRequest(connection_pool_size=256))
+    if webhook_mode:
+        builder = builder.updater(None)
+    else:
+        builder = builder.get_updates_request(InstrumentedRequest(connection_pool_size=1))
+    if PERSISTENCE_FILE:
+        builder = builder.persistence(SQLitePersistence(PERSISTENCE_FILE, PERSISTENCE_INTERVAL))
+    processor = None
+    if UPDATE_WORKERS > 1:
+        processor = PerUserUpdateProcessor(UPDATE_WORKERS)
+        builder = builder.concurrent_updates(processor)
+    app = builder.build()
+
+    metrics.Gauge(
+        'bot_update_queue_depth', "Updates fetched but not yet picked up",
+        app.update_queue.qsize,
+    )
+    if processor is not None:
+        metrics.Gauge(
+            'bot_updates_waiting', "Updates waiting for their user's turn or a worker",
+            lambda: processor.waiting,
+        )
+        metrics.Gauge('bot_updates_active', "Updates being handled", lambda: processor.active)
+
+    # /livez و /readyz
+    health_monitor.polling = not webhook_mode
+    health_monitor.storage = storage
+    if processor is not None:
+        health_monitor.queue_depth = lambda: app.update_queue.qsize() + processor.pending
+        health_monitor.last_processed = lambda: processor.last_processed
+    else:
+        health_monitor.queue_depth = app.update_queue.qsize
+        # التحديثات بالتسلسل: بداية الواحد بعد نهاية اللي قبله
+        health_monitor.last_processed = lambda: last_update_at
+    metrics.Gauge(
+        'bot_event_loop_lag_seconds', "How late the event loop woke up on the last probe",
+        lambda: health_monitor.loop_lag(time.monotonic()) or 0.0,
+    )
+
+    app.add_handler(TypeHandler(Update, note_update), group=-2)
 
-    app = ApplicationBuilder() \
-        .token(BOT_TOKEN) \
-        .build()
+    # حد الرسائل قبل أي شي ثاني
+    app.add_handler(TypeHandler(Update, throttle_update), group=-1)
 
     # إضافة handler للمستخدمين المكتومين
     mute_filter = MuteFilter()
@@ -569,7 +863,9 @@ def main():
             CommandHandler('cancel', cancel),
             CommandHandler('start', start),
         ],
-        allow_reentry=True
+        allow_reentry=True,
+        name='main',
+        persistent=True
     )
     app.add_handler(conv_handler)
 
@@ -582,7 +878,9 @@ def main():
             ],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
-        allow_reentry=True
+        allow_reentry=True,
+        name='hey',
+        persistent=True
     ))
 
     # Conversation handler لـ /user_m
@@ -594,7 +892,9 @@ def main():
             ],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
-        allow_reentry=True
+        allow_reentry=True,
+        name='user_m',
+        persistent=True
     ))
 
     # Conversation handler للبث /new
@@ -602,18 +902,28 @@ def main():
         entry_points=[CommandHandler('new', broadcast_ask_command)],
         states={
             BROADCAST_ASK_MESSAGE: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, broadcast_confirm)
+                MessageHandler(
+                    (filters.TEXT & ~filters.COMMAND) | filters.PHOTO | filters.ANIMATION
+                    | filters.VIDEO | filters.Document.ALL,
+                    broadcast_confirm,
+                )
             ],
             BROADCAST_CONFIRMATION: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, broadcast_execute)
             ],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
-        allow_reentry=True
+        allow_reentry=True,
+        name='broadcast',
+        persistent=True
     ))
 
     # أوامر المشرف الأساسية
     app.add_handler(CommandHandler('active', active_command))
+    app.add_handler(CommandHandler('jobs', jobs_command))
+    app.add_handler(CommandHandler('job_pause', job_pause_command))
+    app.add_handler(CommandHandler('job_resume', job_resume_command))
+    app.add_handler(CommandHandler('job_cancel', job_cancel_command))
     app.add_handler(CommandHandler('help', help_command))
     app.add_handler(CommandHandler('mutelist', mutelist_command))
     app.add_handler(CommandHandler('muteid', muteid_command))
@@ -626,8 +936,36 @@ def main():
     # Error handler
     app.add_error_handler(error_handler)
 
+    # زمن كل handler يظهر بـ /metrics
+    for handlers in app.handlers.values():
+        metrics.time_handlers(handlers)
+    return app
+
+def main():
+    BOT_TOKEN = os.environ.get("BOT_TOKEN")
+    if not BOT_TOKEN:
+        logger.error("BOT_TOKEN environment variable not set!")
+        return
+
+    if cluster.enabled and storage.full_rewrite:
+        # كل worker يعيد كتابة ملفات JSON كاملة فيمسح تغييرات غيره
+        logger.error("Running as a cluster worker needs STORAGE_BACKEND=sqlite")
+        return
+
+    if BOT_MODE == 'webhook':
+        # aiohttp يتحمل بس بهالوضع
+        from webhook import WebhookConfig, run_webhook
+
+        app = build_application(BOT_TOKEN, webhook_mode=True)
+        startup_profile.mark('handlers')
+        logger.info("Starting bot (webhook)...")
+        asyncio.run(run_webhook(app, WebhookConfig.from_env()))
+        return
+
+    app = build_application(BOT_TOKEN)
+    startup_profile.mark('handlers')
     logger.info("Starting bot...")
-    app.run_polling(drop_pending_updates=True)
+    app.run_polling(drop_pending_updates=DROP_PENDING_UPDATES)
 
 if __name__ == '__main__':
     main()
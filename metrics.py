@@ -0,0 +1,170 @@
+import functools
+import logging
+import threading
+import time
+
+from log_setup import sampled
+
+# سجل بسيط بصيغة Prometheus النصية، بدون مكتبات خارجية
+REGISTRY = []
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in zip(labelnames, values)
+    )
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        # /metrics بوضع polling ينرسم من thread خادم الصحة، والـ event loop يضيف labels
+        with self._lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge:
+    """A gauge read from a callback at scrape time, so the hot path pays nothing."""
+
+    def __init__(self, name, documentation, callback, metric_type='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        # 'counter' للقيم المتراكمة اللي يحسبها كائن ثاني (مثل ActivityStore)
+        self.metric_type = metric_type
+        REGISTRY.append(self)
+
+    def render(self):
+        try:
+            value = self.callback()
+        except Exception:
+            return
+        if value is None:
+            return
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.metric_type}"
+        yield f"{self.name} {value}"
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        # الرسم ممكن يصير من thread ثاني (خادم الصحة بوضع polling)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self.values.get(labels)
+            if series is None:
+                # [عدادات الـ buckets..., العدد الكلي, المجموع]
+                series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labelnames + ('le',)
+        # نسخة تحت القفل: الـ buckets والعدد والمجموع من نفس اللحظة
+        with self._lock:
+            values = sorted((labels, list(series)) for labels, series in self.values.items())
+        for labels, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(names, labels + (bound,))} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(names, labels + ('+Inf',))} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-2]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}"
+
+
+# عينات من زمن كل handler كسجلات منظمة (نسبة العينة بـ LOG_SAMPLING)
+latency_log = logging.getLogger('bot.latency')
+
+handler_latency = Histogram(
+    'bot_handler_seconds', "Time spent in each handler callback", ['handler']
+)
+handler_calls = Counter(
+    'bot_handler_calls_total', "Handler calls by handler and the state it returned", ['handler', 'state']
+)
+
+
+def _timed(callback, name):
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        result = None
+        try:
+            result = await callback(*args, **kwargs)
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            handler_latency.observe(elapsed, name)
+            handler_calls.inc(name, str(result))
+            # العينة تنسحب قبل بناء السجل: اللي ما ينختار ما يكلف شي
+            if latency_log.isEnabledFor(logging.INFO) and sampled(latency_log.name):
+                user = getattr(args[0], 'effective_user', None) if args else None
+                latency_log.info(
+                    "%s took %.1fms", name, elapsed * 1000,
+                    extra={
+                        'sampled': True,
+                        'handler': name,
+                        'latency_ms': round(elapsed * 1000, 2),
+                        'user_id': user.id if user else None,
+                        'state': result,
+                    },
+                )
+    return wrapper
+
+
+def time_handlers(handlers):
+    """Wraps the callback of every handler (and nested conversation handler)."""
+    for handler in handlers:
+        if hasattr(handler, 'entry_points'):
+            time_handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                time_handlers(state_handlers)
+            time_handlers(handler.fallbacks)
+        elif getattr(handler, 'callback', None) is not None and not hasattr(handler.callback, '__wrapped__'):
+            handler.callback = _timed(handler.callback, handler.callback.__name__)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_FILE = 'state.db'
+
+
+class SQLitePersistence(BasePersistence):
+    """Conversation states and user_data in SQLite (WAL).
+
+    The Application hands over all changes every `update_interval` seconds
+    as a burst of update_* calls; they are buffered in memory and written
+    as one transaction from a worker thread right after the burst.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS conversations ("
+        " name TEXT NOT NULL, key TEXT NOT NULL, state TEXT NOT NULL,"
+        " PRIMARY KEY (name, key))",
+        "CREATE TABLE IF NOT EXISTS user_data ("
+        " user_id INTEGER PRIMARY KEY, data TEXT NOT NULL)",
+    )
+
+    def __init__(self, path=PERSISTENCE_FILE, update_interval=5.0):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            self.conn.execute(statement)
+        # None كقيمة معناها حذف
+        self._conversations = {}
+        self._user_data = {}
+        self._commit_task = None
+
+    def _read(self, sql, *params):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _schedule_commit(self):
+        if self._commit_task is None:
+            self._commit_task = asyncio.get_running_loop().create_task(self._commit_soon())
+
+    async def _commit_soon(self):
+        # نخلي باقي استدعاءات نفس الدفعة تتجمع قبل الكتابة
+        await asyncio.sleep(0)
+        self._commit_task = None
+        await self._commit()
+
+    async def _commit(self):
+        conversations, self._conversations = self._conversations, {}
+        user_data, self._user_data = self._user_data, {}
+        if not (conversations or user_data):
+            return
+        try:
+            await asyncio.to_thread(self._write, conversations, user_data)
+        except Exception:
+            # مثلاً SQLITE_BUSY لما أكثر من worker يشارك state.db؛ نرجع
+            # التغييرات حتى تنكتب مع الدفعة الجاية بدون ما نغطي على الأحدث
+            logger.exception("Failed to write conversation state")
+            conversations.update(self._conversations)
+            self._conversations = conversations
+            user_data.update(self._user_data)
+            self._user_data = user_data
+
+    def _write(self, conversations, user_data):
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                for (name, key), state in conversations.items():
+                    if state is None:
+                        self.conn.execute(
+                            "DELETE FROM conversations WHERE name = ? AND key = ?", (name, key)
+                        )
+                    else:
+                        self.conn.execute(
+                            "INSERT INTO conversations (name, key, state) VALUES (?, ?, ?) "
+                            "ON CONFLICT(name, key) DO UPDATE SET state = excluded.state",
+                            (name, key, json.dumps(state)),
+                        )
+                for user_id, data in user_data.items():
+                    if data is None:
+                        self.conn.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+                    else:
+                        self.conn.execute(
+                            "INSERT INTO user_data (user_id, data) VALUES (?, ?) "
+                            "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                            (user_id, json.dumps(data, ensure_ascii=False)),
+                        )
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    async def get_conversations(self, name):
+        rows = self._read("SELECT key, state FROM conversations WHERE name = ?", name)
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        self._conversations[(name, json.dumps(list(key)))] = new_state
+        self._schedule_commit()
+
+    async def get_user_data(self):
+        rows = self._read("SELECT user_id, data FROM user_data")
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    async def update_user_data(self, user_id, data):
+        self._user_data[user_id] = data
+        self._schedule_commit()
+
+    async def drop_user_data(self, user_id):
+        self._user_data[user_id] = None
+        self._schedule_commit()
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    # bot_data و chat_data و callback_data ما نستعملها
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        if self._commit_task is not None:
+            await self._commit_task
+        await self._commit()
+        with self._lock:
+            self.conn.close()
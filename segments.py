@@ -0,0 +1,71 @@
+import re
+import time
+
+# أكثر عدد معرفات بقائمة صريحة
+MAX_IDS = 10000
+
+USAGE = (
+    "استخدام: /new [active <أيام>] [unmuted] [ids <id,id,...>]\n"
+    "بدون شي = كل المستخدمين"
+)
+
+
+def parse_segment(args):
+    """Turns /new arguments into a segment dict; raises ValueError on bad input.
+
+    `active N` keeps users seen in the last N days, `unmuted` drops muted
+    users and `ids a,b,c` sends to that list only; they can be combined.
+    The dict is stored in user_data, so it stays JSON-friendly.
+    """
+    segment = {}
+    args = list(args)
+    while args:
+        word = args.pop(0).lower()
+        if word == 'active':
+            if not args:
+                raise ValueError(word)
+            days = int(args.pop(0))
+            if days <= 0:
+                raise ValueError(days)
+            segment['days'] = days
+        elif word == 'unmuted':
+            segment['unmuted'] = True
+        elif word == 'ids':
+            # المعرفات ممكن تنكتب بفواصل أو مسافات، فكل الباقي إلها
+            ids = [int(part) for part in re.split(r'[,\s]+', ' '.join(args)) if part]
+            args = []
+            if not ids or len(ids) > MAX_IDS:
+                raise ValueError(word)
+            segment['ids'] = sorted(set(ids))
+        else:
+            raise ValueError(word)
+    return segment
+
+
+def resolve(segment, registry, muted=(), now=None):
+    """Recipient ids for `segment` from a UserRegistry, in id order."""
+    if 'ids' in segment:
+        audience = segment['ids']
+        if 'days' in segment:
+            cutoff = (now or time.time()) - segment['days'] * 86400
+            audience = [uid for uid in audience if registry.get(uid, -1) >= cutoff]
+    elif 'days' in segment:
+        audience = sorted(registry.seen_since((now or time.time()) - segment['days'] * 86400))
+    else:
+        audience = list(registry)
+    if segment.get('unmuted') and muted:
+        audience = [uid for uid in audience if uid not in muted]
+    return audience
+
+
+def describe(segment):
+    if not segment:
+        return "كل المستخدمين"
+    parts = []
+    if 'ids' in segment:
+        parts.append(f"قائمة من {len(segment['ids'])} معرف")
+    if 'days' in segment:
+        parts.append(f"النشطين بآخر {segment['days']} يوم")
+    if segment.get('unmuted'):
+        parts.append("بدون المكتومين")
+    return "، ".join(parts)
@@ -1,24 +1,53 @@
 # server.py
+import json
 import os
 import threading
-from flask import Flask
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+from health import monitor
 
 # --- tiny HTTP server for Koyeb health checks ---
-app = Flask(__name__)
+# بوضع webhook خادم aiohttp بـ main.py يجاوب على الصحة بنفسه، فما نحتاج هذا
+WEBHOOK_MODE = os.environ.get("BOT_MODE", "polling") == "webhook"
+
+
+class HealthHandler(BaseHTTPRequestHandler):
+    # http.server من المكتبة القياسية بدل Flask: ما يأخر الإقلاع ولا يكبر الصورة
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        # "/" يبقى فحص Koyeb الأصلي؛ الحين يفشل إذا الـ bot وقف فعلاً
+        if path in ('/', '/livez', '/readyz'):
+            report = monitor.report()
+            ok = report['ready'] if path == '/readyz' else report['live']
+            self._send(200 if ok else 503, json.dumps(report).encode(), 'application/json')
+        elif path == '/metrics':
+            self._send(200, metrics.render().encode(), 'text/plain; version=0.0.4')
+        else:
+            self._send(404, b'not found', 'text/plain')
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # الفحوصات كل ثواني؛ ما نحتاج سطر لكل وحدة
+        pass
 
-@app.get("/")
-def health():
-    return "OK", 200
 
-def run_flask():
+def run_health_server():
     port = int(os.environ.get("PORT", 8000))
-    app.run(host="0.0.0.0", port=port)
+    ThreadingHTTPServer(("0.0.0.0", port), HealthHandler).serve_forever()
 
 if __name__ == "__main__":
-    # 1) Start Flask in a background thread (for health checks)
-    threading.Thread(target=run_flask, daemon=True).start()
+    # 1) Start the health server in a background thread - polling mode only
+    if not WEBHOOK_MODE:
+        threading.Thread(target=run_health_server, daemon=True).start()
 
     # 2) Run your Telegram bot in the MAIN thread (so PTB can set signal handlers)
     import main as bot
-    # your main() builds Application and calls run_polling()
+    # your main() builds Application and calls run_polling() or serves the webhook
     bot.main()
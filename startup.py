@@ -0,0 +1,67 @@
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _process_started():
+    # من /proc: بداية العملية نفسها، قبل تحميل المفسر والمكتبات (Linux فقط)
+    try:
+        with open('/proc/self/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        started = float(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+    return time.monotonic() - (uptime - started)
+
+
+class StartupProfile:
+    """Timings of each startup phase, from process start to the first reply.
+
+    mark(phase) closes a phase that follows the previous one; record()
+    stores work that ran alongside (like loading the user registry).
+    Each phase is kept once, so marks on hot paths are cheap no-ops after
+    the first call.
+    """
+
+    def __init__(self):
+        now = time.monotonic()
+        started = _process_started()
+        # الساعتين مو متطابقتين تماماً؛ إذا الفرق غير منطقي نبدأ من الآن
+        if started is None or not 0 <= now - started < 600:
+            started = now
+        self.started_at = started
+        self.phases = {}
+        self._last = started
+        if started < now:
+            self.mark('interpreter', now)
+
+    def mark(self, phase, now=None):
+        if phase in self.phases:
+            return
+        now = now or time.monotonic()
+        self.phases[phase] = (now - self._last, now - self.started_at)
+        self._last = now
+
+    def record(self, phase, seconds):
+        if phase not in self.phases:
+            self.phases[phase] = (seconds, time.monotonic() - self.started_at)
+
+    def report(self):
+        return {
+            phase: {'seconds': round(seconds, 4), 'since_start': round(at, 4)}
+            for phase, (seconds, at) in self.phases.items()
+        }
+
+    def log(self, message="Startup profile"):
+        logger.info(
+            "%s: %s", message,
+            ', '.join(f"{phase} {seconds:.3f}s" for phase, (seconds, _) in self.phases.items()),
+            extra={'startup': self.report()},
+        )
+
+
+profile = StartupProfile()
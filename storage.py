@@ -0,0 +1,282 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+MUTED_USERS_FILE = 'muted_users.json'
+USERS_FILE = 'users.json'
+WELCOME_MSGS_FILE = 'welcome_msgs.json'
+SQLITE_FILE = 'bot.db'
+
+
+def write_json_atomic(path, data, **dump_kwargs):
+    # يكتب لملف مؤقت بنفس المجلد ثم rename حتى لا يبقى الملف نصف مكتوب
+    payload = json.dumps(data, **dump_kwargs).encode('utf-8')
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return len(payload)
+
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            return default
+
+
+class JSONStorage:
+    """The original layout: one JSON file per collection, rewritten whole."""
+
+    # ActivityStore لازم يعطي نسخة كاملة من المستخدمين بكل flush
+    full_rewrite = True
+
+    def __init__(self, users_file=USERS_FILE, muted_file=MUTED_USERS_FILE, welcome_file=WELCOME_MSGS_FILE):
+        self.users_file = users_file
+        self.muted_file = muted_file
+        self.welcome_file = welcome_file
+        self._muted = None
+        self._welcomes = None
+
+    def load_users(self):
+        try:
+            return {int(k): v for k, v in _read_json(self.users_file, {}).items()}
+        except ValueError:
+            return {}
+
+    def iter_users(self):
+        return iter(self.load_users().items())
+
+    def save_users(self, changed, users=None):
+        if users is None:
+            # بدون نسخة كاملة ندمج التغييرات مع الملف الموجود
+            users = self.load_users()
+            for user_id, seen in changed.items():
+                if seen is None:
+                    users.pop(user_id, None)
+                else:
+                    users[user_id] = seen
+        return write_json_atomic(self.users_file, {str(k): v for k, v in users.items()})
+
+    def load_muted(self):
+        self._muted = set(_read_json(self.muted_file, []))
+        return set(self._muted)
+
+    def set_muted(self, user_id, muted):
+        if self._muted is None:
+            self.load_muted()
+        if muted:
+            self._muted.add(user_id)
+        else:
+            self._muted.discard(user_id)
+        write_json_atomic(self.muted_file, list(self._muted))
+
+    def load_welcomes(self):
+        try:
+            self._welcomes = {int(k): v for k, v in _read_json(self.welcome_file, {}).items()}
+        except ValueError:
+            self._welcomes = {}
+        return dict(self._welcomes)
+
+    def set_welcome(self, user_id, text):
+        if self._welcomes is None:
+            self.load_welcomes()
+        if text is None:
+            self._welcomes.pop(user_id, None)
+        else:
+            self._welcomes[user_id] = text
+        write_json_atomic(
+            self.welcome_file,
+            {str(k): v for k, v in self._welcomes.items()},
+            ensure_ascii=False,
+        )
+
+    def check_writable(self):
+        # نفس طريقة الكتابة الفعلية: ملف مؤقت بنفس المجلد
+        directory = os.path.dirname(os.path.abspath(self.users_file))
+        fd, probe = tempfile.mkstemp(prefix='.probe-', dir=directory)
+        try:
+            os.write(fd, b'ok')
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+            os.unlink(probe)
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage:
+    """Row-level storage in a single SQLite database running in WAL mode."""
+
+    full_rewrite = False
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS users ("
+        " user_id INTEGER PRIMARY KEY,"
+        " last_seen TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS users_last_seen ON users (last_seen)",
+        "CREATE TABLE IF NOT EXISTS muted_users (user_id INTEGER PRIMARY KEY)",
+        "CREATE TABLE IF NOT EXISTS welcome_msgs ("
+        " user_id INTEGER PRIMARY KEY,"
+        " text TEXT NOT NULL)",
+    )
+
+    def __init__(self, path=SQLITE_FILE):
+        self.path = path
+        # الـ flush يصير من thread ثاني، فنحمي الاتصال بقفل
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            self.conn.execute(statement)
+
+    def _write(self, *batches):
+        # كل (sql, rows) بنفس الـ transaction
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                for batch_sql, batch_rows in batches:
+                    self.conn.executemany(batch_sql, batch_rows)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def load_users(self):
+        with self._lock:
+            return dict(self.conn.execute("SELECT user_id, last_seen FROM users"))
+
+    def iter_users(self, batch=10000):
+        # دفعات مرتبة بدل dict كامل: UserRegistry يبني مصفوفاته مباشرة.
+        # اتصال قراءة منفصل (WAL يسمح): التحميل بالخلفية ياخذ وقت وما لازم
+        # يمسك self._lock عن الكتم والترحيب وفحص الصحة طول هالمدة
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            cursor = conn.execute("SELECT user_id, last_seen FROM users ORDER BY user_id")
+            while True:
+                rows = cursor.fetchmany(batch)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            conn.close()
+
+    def load_users_since(self, since):
+        # نصوص ISO تترتب مثل التواريخ، فالفهرس على last_seen يكفي
+        with self._lock:
+            return dict(self.conn.execute(
+                "SELECT user_id, last_seen FROM users WHERE last_seen > ?", (since,)
+            ))
+
+    def save_users(self, changed, users=None):
+        # قيمة None معناها المستخدم انحذف (مثلاً حظر البوت)
+        upserts = [(k, v) for k, v in changed.items() if v is not None]
+        deletes = [(k,) for k, v in changed.items() if v is None]
+        self._write(
+            ("INSERT INTO users (user_id, last_seen) VALUES (?, ?) "
+             "ON CONFLICT(user_id) DO UPDATE SET last_seen = excluded.last_seen", upserts),
+            ("DELETE FROM users WHERE user_id = ?", deletes),
+        )
+        return sum(len(v) + 8 for _, v in upserts) + 8 * len(deletes)
+
+    def load_muted(self):
+        with self._lock:
+            return {row[0] for row in self.conn.execute("SELECT user_id FROM muted_users")}
+
+    def set_muted(self, user_id, muted):
+        if muted:
+            self._write(("INSERT OR IGNORE INTO muted_users (user_id) VALUES (?)", [(user_id,)]))
+        else:
+            self._write(("DELETE FROM muted_users WHERE user_id = ?", [(user_id,)]))
+
+    def load_welcomes(self):
+        with self._lock:
+            return dict(self.conn.execute("SELECT user_id, text FROM welcome_msgs"))
+
+    def set_welcome(self, user_id, text):
+        if text is None:
+            self._write(("DELETE FROM welcome_msgs WHERE user_id = ?", [(user_id,)]))
+        else:
+            self._write((
+                "INSERT INTO welcome_msgs (user_id, text) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET text = excluded.text",
+                [(user_id, text)],
+            ))
+
+    def check_writable(self):
+        # BEGIN IMMEDIATE ياخذ قفل الكتابة، فيفشل إذا القاعدة مقفولة أو للقراءة فقط
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("ROLLBACK")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def open_storage(backend=None):
+    backend = backend or os.environ.get("STORAGE_BACKEND", "json")
+    if backend == "sqlite":
+        return SQLiteStorage(os.environ.get("STORAGE_DB", SQLITE_FILE))
+    if backend == "json":
+        return JSONStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def migrate_json_to_sqlite(source, target):
+    users = source.load_users()
+    muted = source.load_muted()
+    welcomes = source.load_welcomes()
+    # كلها بـ transaction وحدة: سطر لكل commit بطيء ويخلي النقل نص مكتمل إذا انقطع
+    target._write(
+        ("INSERT INTO users (user_id, last_seen) VALUES (?, ?) "
+         "ON CONFLICT(user_id) DO UPDATE SET last_seen = excluded.last_seen", list(users.items())),
+        ("INSERT OR IGNORE INTO muted_users (user_id) VALUES (?)", [(uid,) for uid in muted]),
+        ("INSERT INTO welcome_msgs (user_id, text) VALUES (?, ?) "
+         "ON CONFLICT(user_id) DO UPDATE SET text = excluded.text", list(welcomes.items())),
+    )
+    return len(users), len(muted), len(welcomes)
+
+
+def _cli():
+    parser = argparse.ArgumentParser(description="Bot storage tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    migrate = sub.add_parser('migrate', help="copy the JSON files into an SQLite database")
+    migrate.add_argument('--db', default=os.environ.get("STORAGE_DB", SQLITE_FILE))
+    migrate.add_argument('--users', default=USERS_FILE)
+    migrate.add_argument('--muted', default=MUTED_USERS_FILE)
+    migrate.add_argument('--welcomes', default=WELCOME_MSGS_FILE)
+    args = parser.parse_args()
+
+    source = JSONStorage(args.users, args.muted, args.welcomes)
+    target = SQLiteStorage(args.db)
+    try:
+        users, muted, welcomes = migrate_json_to_sqlite(source, target)
+    finally:
+        target.close()
+    print(f"Migrated {users} users, {muted} muted, {welcomes} welcome messages into {args.db}")
+
+
+if __name__ == '__main__':
+    _cli()
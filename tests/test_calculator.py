@@ -0,0 +1,88 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calculator
+
+
+class ParseEntriesTest(unittest.TestCase):
+    CASES = [
+        ('3', [(None, [3.0])]),
+        ('.5', [(None, [0.5])]),
+        ('5.', [(None, [5.0])]),
+        ('1e3', [(None, [1000.0])]),
+        ('3,5', [(None, [3.0]), (None, [5.0])]),
+        ('3، 2؛ 1.5', [(None, [3.0]), (None, [2.0]), (None, [1.5])]),
+        ('٣٫٥', [(None, [3.5])]),
+        ('۲', [(None, [2.0])]),
+        ('رياضيات 3', [('رياضيات', [3.0])]),
+        ('رياضيات: ٣\nفيزياء 2', [('رياضيات', [3.0]), ('فيزياء', [2.0])]),
+    ]
+    INVALID = ['مرحبا', '3e', '1.2.3', '3 5x', 'e3']
+
+    def test_valid(self):
+        for text, expected in self.CASES:
+            with self.subTest(text=text):
+                self.assertEqual(calculator.parse_entries(text), expected)
+
+    def test_invalid(self):
+        for text in self.INVALID:
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    calculator.parse_entries(text)
+
+    def test_batch_limit(self):
+        with self.assertRaises(OverflowError):
+            calculator.parse_entries('\n'.join(['1'] * (calculator.MAX_BATCH + 1)))
+
+
+class AbsenceReplyTest(unittest.TestCase):
+    CASES = [
+        ('theoretical', '.5', "غيابك للنظري هو: 0.94"),
+        ('theoretical', '3', "غيابك للنظري هو: 5.65"),
+        ('theoretical', '٣', "غيابك للنظري هو: 5.65"),
+        ('practical', '1.5', "غيابك للعملي هو: 1.41"),
+        ('practical', '0.5', "غيابك للعملي هو: 0.47"),
+        ('theoretical', '3,5', "غيابك للنظري:\n• 3: 5.65\n• 5: 9.41"),
+    ]
+    INVALID = [('theoretical', '0'), ('theoretical', '-.5'), ('practical', ''), ('practical', 'x')]
+
+    def test_valid(self):
+        for kind, text, expected in self.CASES:
+            with self.subTest(kind=kind, text=text):
+                self.assertEqual(calculator.absence_reply(kind, text), expected)
+
+    def test_invalid(self):
+        for kind, text in self.INVALID:
+            with self.subTest(kind=kind, text=text):
+                with self.assertRaises(ValueError):
+                    calculator.absence_reply(kind, text)
+
+
+class BlokBatchReplyTest(unittest.TestCase):
+    CASES = [
+        ('40 100 80', "درجتك بلبلوك هي: 32.00"),
+        ('40, 100, 80', "درجتك بلبلوك هي: 32.00"),
+        ('٤٠ ١٠٠ ٨٠', "درجتك بلبلوك هي: 32.00"),
+        ('فسلجة 40 100 80\n30 50 25', "درجاتك بلبلوك:\n• فسلجة: 32.00\n• 2: 15.00"),
+        # مو ثلاث أرقام: يكمل بالأسئلة خطوة خطوة
+        ('40', None),
+        ('40 100', None),
+    ]
+
+    def test_valid(self):
+        for text, expected in self.CASES:
+            with self.subTest(text=text):
+                self.assertEqual(calculator.blok_batch_reply(text), expected)
+
+    def test_zero_total(self):
+        for text in ('40 0 80', '40 ٠ 80\n30 50 25'):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    calculator.blok_batch_reply(text)
+
+
+if __name__ == '__main__':
+    unittest.main()
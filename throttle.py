@@ -0,0 +1,61 @@
+import time
+
+import metrics
+
+shed_total = metrics.Counter('bot_throttled_updates_total', "Updates dropped by flood control")
+auto_mutes_total = metrics.Counter('bot_auto_mutes_total', "Users muted automatically for flooding")
+
+SWEEP_INTERVAL = 60.0
+
+
+class FloodControl:
+    """Per-user token bucket kept as one float per user (GCRA).
+
+    For each user we only store the "theoretical arrival time" of its next
+    message; an update is allowed while that time is at most `burst`
+    intervals ahead of now. Users whose bucket has refilled are evicted by
+    a sweep every SWEEP_INTERVAL seconds, so the table only holds users
+    active in the last few seconds.
+    """
+
+    def __init__(self, rate=1.0, burst=5, mute_after=0, mute_window=60.0):
+        self.interval = 1.0 / rate
+        self.tolerance = self.interval * (burst - 1)
+        self.mute_after = mute_after
+        self.mute_window = mute_window
+        self.tat = {}
+        # فقط للي تجاوزوا الحد: [عدد المرفوض، بداية النافذة]
+        self.offences = {}
+        self.shed = 0
+        self._last_sweep = time.monotonic()
+
+    def allow(self, user_id, now=None):
+        now = now or time.monotonic()
+        if now - self._last_sweep > SWEEP_INTERVAL:
+            self.sweep(now)
+        tat = max(self.tat.get(user_id, now), now)
+        if tat - now > self.tolerance:
+            return False
+        self.tat[user_id] = tat + self.interval
+        return True
+
+    def record_shed(self, user_id, now=None):
+        """Counts a dropped update; returns (first_in_window, should_mute)."""
+        now = now or time.monotonic()
+        self.shed += 1
+        shed_total.inc()
+        entry = self.offences.get(user_id)
+        if entry is None or now - entry[1] > self.mute_window:
+            entry = self.offences[user_id] = [0, now]
+        entry[0] += 1
+        should_mute = bool(self.mute_after) and entry[0] >= self.mute_after
+        return entry[0] == 1, should_mute
+
+    def sweep(self, now=None):
+        now = now or time.monotonic()
+        self._last_sweep = now
+        self.tat = {uid: tat for uid, tat in self.tat.items() if tat > now}
+        self.offences = {
+            uid: entry for uid, entry in self.offences.items()
+            if now - entry[1] <= self.mute_window
+        }
@@ -1,15 +1,30 @@
 # traffic_simulator.py
+import argparse
+import array
 import asyncio
+import bisect
+import csv
+import json
+import math
+import multiprocessing
+import os
 import random
+import sys
 import time
+import zlib
 import logging
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from urllib.parse import urlsplit
 import aiohttp
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
+from log_setup import setup_logging
+
 # ================== CONFIG ==================
 # غيّر BASE_URL إلى رابط موقعك (يجب أن يبدأ بـ http:// أو https://)
-BASE_URL = "https://your-site.example"
+BASE_URL = os.environ.get("TRAFFIC_BASE_URL", "https://your-site.example")
 
 # قائمة المسارات التي تريد أن يزورهم السكربت
 ENDPOINTS = [
@@ -20,7 +35,10 @@ ENDPOINTS = [
 ]
 
 # كم طلب يرسل كل دورة (خليها صغيرة: 1-8)
-REQUESTS_PER_RUN = 5
+REQUESTS_PER_RUN = int(os.environ.get("TRAFFIC_REQUESTS_PER_RUN", "5"))
+
+# كل كم دقيقة تنعاد الدورة بوضع schedule
+RUN_INTERVAL_MINUTES = float(os.environ.get("TRAFFIC_INTERVAL_MINUTES", "30"))
 
 # ثواني الانتظار العشوائي بين الطلبات داخل نفس الجولة
 MIN_INTERVAL_BETWEEN_REQS = 0.5
@@ -28,18 +46,51 @@ MAX_EXTRA_SLEEP = 1.5
 
 # مهلة الطلب بالثواني
 REQUEST_TIMEOUT = 15
+# المهلة مقسومة: فتح الاتصال، وبين كل قطعة وقطعة من الرد (مو مجموع التحميل)
+CONNECT_TIMEOUT = float(os.environ.get("TRAFFIC_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("TRAFFIC_READ_TIMEOUT", str(REQUEST_TIMEOUT)))
+
+# الرد يتقرا قطعة قطعة وما ينحفظ، فالذاكرة ما تكبر مع حجم الصفحات
+CHUNK_SIZE = int(os.environ.get("TRAFFIC_CHUNK_SIZE", str(64 * 1024)))
+# قياسات اختيارية: زمن أول بايت، وCRC32 للمحتوى (يكشف صفحات تتغير بين الطلبات)
+MEASURE_TTFB = os.environ.get("TRAFFIC_TTFB", "1") != "0"
+MEASURE_CHECKSUM = os.environ.get("TRAFFIC_CHECKSUM", "0") != "0"
 
 # مسار ملف اللوق
-LOG_FILE = "traffic.log"
+LOG_FILE = os.environ.get("TRAFFIC_LOG_FILE", "traffic.log")
+
+# ---------- وضع load (حمل مفتوح open-loop) ----------
+# الطلبات تنطلق بمواعيد Poisson بمعدل TRAFFIC_RPS بغض النظر عن سرعة الرد،
+# وإذا وصلنا حد التزامن الطلب ينحسب "dropped" بدل ما ينتظر
+TARGET_RPS = float(os.environ.get("TRAFFIC_RPS", "10"))
+CONCURRENCY = int(os.environ.get("TRAFFIC_CONCURRENCY", "100"))
+# المراحل بالثواني: صعود تدريجي، ثبات، نزول
+RAMP_UP_SECONDS = float(os.environ.get("TRAFFIC_RAMP_UP", "10"))
+STEADY_SECONDS = float(os.environ.get("TRAFFIC_DURATION", "60"))
+RAMP_DOWN_SECONDS = float(os.environ.get("TRAFFIC_RAMP_DOWN", "5"))
+# أوزان المسارات "path=weight,..."؛ فارغ = ENDPOINTS بأوزان متساوية
+ENDPOINT_WEIGHTS = os.environ.get("TRAFFIC_ENDPOINTS", "")
+# مجمع الاتصالات: 0 = نفس حد التزامن
+LIMIT_PER_HOST = int(os.environ.get("TRAFFIC_LIMIT_PER_HOST", "0"))
+DNS_CACHE_SECONDS = int(os.environ.get("TRAFFIC_DNS_CACHE", "300"))
+KEEPALIVE_SECONDS = float(os.environ.get("TRAFFIC_KEEPALIVE", "30"))
+# عدد العمليات: كل وحدة event loop ومجمع اتصالات خاص، والمعدل والتزامن يتقسمون عليها
+WORKERS = int(os.environ.get("TRAFFIC_WORKERS", "1"))
+
+# ---------- تصدير النتائج ----------
+# كل تشغيل load ينحفظ بمجلد: requests.csv (سطر لكل طلب) و summary.json
+RESULTS_DIR = os.environ.get("TRAFFIC_RESULTS_DIR", "traffic_runs")
+# الصفوف تتجمع بمصفوفات وتنكتب للملف كل هالعدد
+EXPORT_FLUSH_ROWS = int(os.environ.get("TRAFFIC_EXPORT_FLUSH_ROWS", "10000"))
+# compare يعلّم تراجع إذا زادت النسبة المئوية بأكثر من هذا (%) وبأكثر من REGRESSION_MIN_MS
+REGRESSION_THRESHOLD = float(os.environ.get("TRAFFIC_REGRESSION_THRESHOLD", "10"))
+REGRESSION_MIN_MS = float(os.environ.get("TRAFFIC_REGRESSION_MIN_MS", "1"))
 
 # ============================================
 
-# إعداد اللوج
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s"
-)
+# إعداد اللوج: طابور غير حاجب، JSON، والملف يتدوّر (شوف log_setup.py)
+setup_logging(log_file=LOG_FILE)
+logger = logging.getLogger("traffic")
 
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36",
@@ -48,7 +99,47 @@ USER_AGENTS = [
     "curl/7.68.0"
 ]
 
-async def do_request(session: aiohttp.ClientSession, path: str):
+_session = None
+
+def get_session(concurrency=None):
+    """The one ClientSession of the process, created on first use.
+
+    Scheduled runs and load runs share it, so keep-alive connections and
+    cached DNS answers survive between runs.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=make_connector(concurrency or CONCURRENCY),
+            timeout=aiohttp.ClientTimeout(
+                total=None, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT
+            ),
+        )
+    return _session
+
+async def close_session():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+async def fetch(session, url, headers=None, checksum=MEASURE_CHECKSUM):
+    """GET `url` streaming the body; returns (status, size, ttfb, crc32 or None).
+
+    ttfb is the time until the status line and headers arrived.
+    """
+    start = time.perf_counter()
+    async with session.get(url, headers=headers) as resp:
+        ttfb = time.perf_counter() - start
+        size = 0
+        crc = 0 if checksum else None
+        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+            size += len(chunk)
+            if crc is not None:
+                crc = zlib.crc32(chunk, crc)
+        return resp.status, size, ttfb, crc
+
+async def do_request(session: aiohttp.ClientSession, path: str, results=None):
     # يبني الرابط الصحيح
     if path.startswith("/"):
         url = BASE_URL.rstrip("/") + path
@@ -67,65 +158,684 @@ async def do_request(session: aiohttp.ClientSession, path: str):
 
     start = time.perf_counter()
     try:
-        async with session.get(url, headers=headers, timeout=REQUEST_TIMEOUT) as resp:
-            try:
-                content = await resp.read()
-                size = len(content)
-            except Exception:
-                size = 0
-            elapsed = (time.perf_counter() - start)
-            logging.info(f"REQ GET {path} -> {resp.status} ({elapsed:.2f}s) size={size}")
+        status, size, ttfb, crc = await fetch(session, url, headers)
+        elapsed = (time.perf_counter() - start)
+        if results is not None:
+            results.add(time.time(), path, elapsed, status, size, ttfb=ttfb)
+        logger.info(
+            "REQ GET %s -> %s (%.2fs, ttfb %.2fs) size=%s", path, status, elapsed, ttfb, size,
+            extra={'path': path, 'status': status, 'latency_ms': round(elapsed * 1000, 2), 'size': size},
+        )
     except Exception as e:
         elapsed = (time.perf_counter() - start)
-        logging.warning(f"ERR GET {path} -> {e} ({elapsed:.2f}s)")
+        if results is not None:
+            results.add(time.time(), path, elapsed, error=type(e).__name__)
+        logger.warning(
+            "ERR GET %s -> %r (%.2fs)", path, e, elapsed,
+            extra={'path': path, 'latency_ms': round(elapsed * 1000, 2)},
+        )
 
 async def run_once():
-    logging.info("Starting run_once")
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for i in range(REQUESTS_PER_RUN):
-            path = random.choice(ENDPOINTS)
-            tasks.append(do_request(session, path))
-            # انتظار صغير عشوائي حتى لا تكون الزيارات متزامنة
-            await asyncio.sleep(MIN_INTERVAL_BETWEEN_REQS + random.random() * MAX_EXTRA_SLEEP)
-        # ننتظر اكتمال كل الطلبات
-        await asyncio.gather(*tasks, return_exceptions=True)
-    logging.info("Run complete")
+    logger.info("Starting run_once")
+    session = get_session()
+    # الجولات المجدولة تنضاف لنفس الملف، وعمود t_ms فيها وقت Unix
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results = ResultBuffer(os.path.join(RESULTS_DIR, "scheduled.csv"))
+    tasks = []
+    for i in range(REQUESTS_PER_RUN):
+        path = random.choice(ENDPOINTS)
+        tasks.append(asyncio.ensure_future(do_request(session, path, results)))
+        # انتظار صغير عشوائي حتى لا تكون الزيارات متزامنة
+        await asyncio.sleep(MIN_INTERVAL_BETWEEN_REQS + random.random() * MAX_EXTRA_SLEEP)
+    # ننتظر اكتمال كل الطلبات
+    await asyncio.gather(*tasks, return_exceptions=True)
+    results.flush()
+    logger.info("Run complete")
 
-def schedule_every_30_minutes():
+def schedule_runs(interval_minutes=RUN_INTERVAL_MINUTES):
     scheduler = AsyncIOScheduler(timezone="UTC")
-    # شغل أول جولة فوراً ثم كل 30 دقيقة
-    scheduler.add_job(lambda: asyncio.create_task(run_once()), "interval", minutes=30, next_run_time=datetime.now())
+    # شغل أول جولة فوراً ثم كل interval_minutes
+    scheduler.add_job(lambda: asyncio.create_task(run_once()), "interval", minutes=interval_minutes, next_run_time=datetime.now())
     scheduler.start()
-    logging.info("Scheduled traffic simulator every 30 minutes")
+    logger.info("Scheduled traffic simulator every %s minutes", interval_minutes)
+
+def schedule_every_30_minutes():
+    schedule_runs(30)
+
+
+# ================== LOAD MODE ==================
+
+class LatencyHistogram:
+    """Log-linear latency histogram in the spirit of HdrHistogram.
+
+    Values are recorded in microseconds and bucketed keeping SIGNIFICANT_BITS
+    of precision, so any percentile is within 1% of the true value while
+    memory stays a few hundred buckets regardless of the sample count.
+    Histograms from different runs or workers can be merged.
+    """
+
+    SIGNIFICANT_BITS = 8
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, seconds):
+        micros = max(0, int(seconds * 1_000_000))
+        shift = max(0, micros.bit_length() - self.SIGNIFICANT_BITS)
+        self.buckets[(micros >> shift) << shift] += 1
+        self.count += 1
+        self.total += micros
+        self.min = micros if self.min is None else min(self.min, micros)
+        self.max = max(self.max, micros)
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, pct):
+        """Value in seconds below which `pct` percent of samples fall."""
+        if not self.count:
+            return 0.0
+        target = max(1, math.ceil(self.count * pct / 100))
+        seen = 0
+        for value in sorted(self.buckets):
+            seen += self.buckets[value]
+            if seen >= target:
+                return min(value, self.max) / 1_000_000
+        return self.max / 1_000_000
+
+    @property
+    def mean(self):
+        return self.total / self.count / 1_000_000 if self.count else 0.0
+
+
+class ResultBuffer:
+    """Per-request results kept column by column in typed arrays.
+
+    A row costs ~30 bytes instead of a dict or a log line; every
+    `flush_rows` rows the columns are appended to a CSV file and cleared,
+    so memory stays flat however long the run is.
+    """
+
+    COLUMNS = ('t_ms', 'path', 'status', 'error', 'latency_ms', 'ttfb_ms', 'bytes')
+
+    def __init__(self, path, flush_rows=EXPORT_FLUSH_ROWS):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.paths = []
+        self.errors = ['']
+        self._path_ids = {}
+        self._error_ids = {'': 0}
+        self.rows = 0
+        self._reset()
+        if not os.path.exists(path):
+            with open(path, 'w', newline='') as f:
+                csv.writer(f).writerow(self.COLUMNS)
+
+    def _reset(self):
+        self.t = array.array('d')
+        self.path_id = array.array('H')
+        self.status = array.array('H')
+        self.error_id = array.array('H')
+        self.latency = array.array('f')
+        self.ttfb = array.array('f')
+        self.size = array.array('Q')
+
+    @staticmethod
+    def _intern(value, table, ids):
+        index = ids.get(value)
+        if index is None:
+            index = ids[value] = len(table)
+            table.append(value)
+        return index
+
+    def add(self, t, path, seconds, status=None, size=0, error=None, ttfb=None):
+        self.t.append(t * 1000)
+        self.path_id.append(self._intern(path, self.paths, self._path_ids))
+        self.status.append(status or 0)
+        self.error_id.append(self._intern(error or '', self.errors, self._error_ids))
+        self.latency.append(seconds * 1000)
+        self.ttfb.append(-1.0 if ttfb is None else ttfb * 1000)
+        self.size.append(size)
+        self.rows += 1
+        if len(self.t) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.t:
+            return
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            for i in range(len(self.t)):
+                ttfb = self.ttfb[i]
+                writer.writerow((
+                    f"{self.t[i]:.3f}", self.paths[self.path_id[i]], self.status[i] or '',
+                    self.errors[self.error_id[i]], f"{self.latency[i]:.3f}",
+                    f"{ttfb:.3f}" if ttfb >= 0 else '', self.size[i],
+                ))
+        self._reset()
+
+
+def parse_weights(spec, default_paths=ENDPOINTS):
+    """'/=5,/search?q=x=1' -> [(path, weight)]; the last '=' splits the weight."""
+    if not spec:
+        return [(path, 1.0) for path in default_paths]
+    weights = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        path, sep, weight = item.rpartition('=')
+        try:
+            weights.append((path, float(weight)) if sep else (item, 1.0))
+        except ValueError:
+            # "=" جزء من الاستعلام وما في وزن
+            weights.append((item, 1.0))
+    return weights
+
+
+def build_phases(rps, ramp_up, steady, ramp_down):
+    # (الاسم، المدة، المعدل بالبداية، المعدل بالنهاية)
+    phases = [
+        ('ramp-up', ramp_up, 0.0, rps),
+        ('steady', steady, rps, rps),
+        ('ramp-down', ramp_down, rps, 0.0),
+    ]
+    return [phase for phase in phases if phase[1] > 0]
+
+
+def rate_at(phases, t):
+    """Target rate `t` seconds into the run, or None once all phases are over."""
+    for name, duration, start_rate, end_rate in phases:
+        if t < duration:
+            return name, start_rate + (end_rate - start_rate) * t / duration
+        t -= duration
+    return None
+
+
+class LoadStats:
+    def __init__(self):
+        self.latency = defaultdict(LatencyHistogram)
+        self.overall = LatencyHistogram()
+        self.ttfb = LatencyHistogram()
+        # CRC32 المختلفة لكل مسار (لما MEASURE_CHECKSUM مفعّل)
+        self.checksums = defaultdict(set)
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.per_phase = Counter()
+        # لكل مسار: البايتات، والفاشلة (استثناء أو 5xx)
+        self.bytes_by_path = Counter()
+        self.failures = Counter()
+        self.scheduled = 0
+        self.dropped = 0
+        self.bytes = 0
+        self.started = None
+        self.clock_start = time.perf_counter()
+        self.elapsed = 0.0
+        self.results = None
+
+    def record(self, path, seconds, status=None, size=0, error=None, ttfb=None, crc=None):
+        self.latency[path].record(seconds)
+        self.overall.record(seconds)
+        self.bytes += size
+        self.bytes_by_path[path] += size
+        if error is not None or status >= 500:
+            self.failures[path] += 1
+        if self.results is not None:
+            self.results.add(time.perf_counter() - self.clock_start, path, seconds,
+                             status, size, error, ttfb)
+        if ttfb is not None:
+            self.ttfb.record(ttfb)
+        if crc is not None and len(self.checksums[path]) < 100:
+            self.checksums[path].add(crc)
+        if error is not None:
+            self.errors[error] += 1
+        else:
+            self.statuses[status] += 1
+
+    def summary(self):
+        lines = []
+        completed = self.overall.count
+        lines.append(
+            f"scheduled {self.scheduled}, completed {completed}, dropped {self.dropped} "
+            f"(concurrency cap), errors {sum(self.errors.values())} in {self.elapsed:.1f}s"
+        )
+        if self.elapsed:
+            lines.append(f"throughput {completed / self.elapsed:.1f} req/s, "
+                         f"{self.bytes / self.elapsed / 1024:.1f} KiB/s")
+        lines.append("phases: " + ", ".join(f"{name}={n}" for name, n in self.per_phase.items()))
+        lines.append("statuses: " + ", ".join(f"{code}={n}" for code, n in sorted(self.statuses.items())))
+        if self.errors:
+            lines.append("errors: " + ", ".join(f"{name}={n}" for name, n in self.errors.most_common()))
+        if self.ttfb.count:
+            lines.append(f"ttfb p50 {self.ttfb.percentile(50) * 1000:.1f} ms, "
+                         f"p99 {self.ttfb.percentile(99) * 1000:.1f} ms")
+        if self.checksums:
+            lines.append("distinct bodies: " + ", ".join(
+                f"{path}={len(crcs)}" for path, crcs in sorted(self.checksums.items())))
+        lines.append(f"{'endpoint':<28} {'count':>7} {'p50 ms':>8} {'p90 ms':>8} "
+                     f"{'p99 ms':>8} {'p99.9 ms':>9} {'max ms':>8}")
+        rows = sorted(self.latency.items()) + [('ALL', self.overall)]
+        for path, hist in rows:
+            lines.append(
+                f"{path[:28]:<28} {hist.count:>7} {hist.percentile(50) * 1000:>8.1f} "
+                f"{hist.percentile(90) * 1000:>8.1f} {hist.percentile(99) * 1000:>8.1f} "
+                f"{hist.percentile(99.9) * 1000:>9.1f} {hist.max / 1000:>8.1f}"
+            )
+        return "\n".join(lines)
+
+    def merge(self, other):
+        """Adds another worker's stats; both must cover the same time window."""
+        for path, hist in other.latency.items():
+            self.latency[path].merge(hist)
+        self.overall.merge(other.overall)
+        self.ttfb.merge(other.ttfb)
+        for path, crcs in other.checksums.items():
+            self.checksums[path] |= crcs
+        for mine, theirs in ((self.statuses, other.statuses), (self.errors, other.errors),
+                             (self.per_phase, other.per_phase), (self.bytes_by_path, other.bytes_by_path),
+                             (self.failures, other.failures)):
+            mine.update(theirs)
+        self.scheduled += other.scheduled
+        self.dropped += other.dropped
+        self.bytes += other.bytes
+        self.elapsed = max(self.elapsed, other.elapsed)
+
+    def _aggregate(self, hist, nbytes, failures):
+        return {
+            'count': hist.count,
+            'p50_ms': round(hist.percentile(50) * 1000, 3),
+            'p90_ms': round(hist.percentile(90) * 1000, 3),
+            'p99_ms': round(hist.percentile(99) * 1000, 3),
+            'p999_ms': round(hist.percentile(99.9) * 1000, 3),
+            'mean_ms': round(hist.mean * 1000, 3),
+            'max_ms': round(hist.max / 1000, 3),
+            'error_rate': round(failures / hist.count, 5) if hist.count else 0.0,
+            'rps': round(hist.count / self.elapsed, 2) if self.elapsed else 0.0,
+            'bytes_per_sec': round(nbytes / self.elapsed, 1) if self.elapsed else 0.0,
+        }
+
+    def to_dict(self):
+        endpoints = {
+            path: self._aggregate(hist, self.bytes_by_path[path], self.failures[path])
+            for path, hist in sorted(self.latency.items())
+        }
+        endpoints['ALL'] = self._aggregate(self.overall, self.bytes, sum(self.failures.values()))
+        return {
+            'elapsed_seconds': round(self.elapsed, 3),
+            'scheduled': self.scheduled,
+            'dropped': self.dropped,
+            'statuses': {str(code): n for code, n in sorted(self.statuses.items())},
+            'errors': dict(self.errors),
+            'phases': dict(self.per_phase),
+            'ttfb_p50_ms': round(self.ttfb.percentile(50) * 1000, 3),
+            'ttfb_p99_ms': round(self.ttfb.percentile(99) * 1000, 3),
+            'endpoints': endpoints,
+        }
+
+
+def new_run_dir(results_dir=RESULTS_DIR):
+    run_dir = os.path.join(results_dir, datetime.utcnow().strftime("%Y%m%dT%H%M%SZ"))
+    os.makedirs(run_dir, exist_ok=True)
+    return run_dir
+
+
+def write_summary(run_dir, stats, config):
+    summary = dict(stats.to_dict(), config=config)
+    with open(os.path.join(run_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    return summary
+
+
+def load_summary(path):
+    # يقبل مجلد التشغيل أو ملف summary.json نفسه
+    if os.path.isdir(path):
+        path = os.path.join(path, "summary.json")
+    with open(path) as f:
+        return json.load(f)
+
+
+COMPARED_METRICS = ('p50_ms', 'p90_ms', 'p99_ms', 'error_rate', 'rps')
+
+
+def compare_runs(base, new, threshold=REGRESSION_THRESHOLD, min_ms=REGRESSION_MIN_MS):
+    """Rows of (endpoint, metric, base, new, change %, flag) for two summaries.
+
+    A latency percentile is a regression when it grows by more than
+    `threshold` percent and by more than `min_ms`; error rate when it grows
+    by more than a percentage point.
+    """
+    rows = []
+    for path in sorted(set(base['endpoints']) | set(new['endpoints']), key=lambda p: (p == 'ALL', p)):
+        old_stats = base['endpoints'].get(path)
+        new_stats = new['endpoints'].get(path)
+        if old_stats is None or new_stats is None:
+            rows.append((path, 'count', old_stats and old_stats['count'], new_stats and new_stats['count'],
+                         None, 'only in ' + ('new' if old_stats is None else 'base')))
+            continue
+        for metric in COMPARED_METRICS:
+            old, current = old_stats[metric], new_stats[metric]
+            change = (current - old) / old * 100 if old else None
+            flag = ''
+            if metric.endswith('_ms'):
+                if current - old > min_ms and (change is None or change > threshold):
+                    flag = 'REGRESSION'
+                elif old - current > min_ms and change is not None and change < -threshold:
+                    flag = 'improved'
+            elif metric == 'error_rate' and current - old > 0.01:
+                flag = 'REGRESSION'
+            rows.append((path, metric, old, current, change, flag))
+    return rows
+
+
+def format_comparison(rows):
+    lines = [f"{'endpoint':<28} {'metric':<10} {'base':>10} {'new':>10} {'change':>8}"]
+    for path, metric, old, current, change, flag in rows:
+        change_text = '' if change is None else f"{change:+.1f}%"
+        lines.append(f"{path[:28]:<28} {metric:<10} {old if old is not None else '-':>10} "
+                     f"{current if current is not None else '-':>10} {change_text:>8}  {flag}")
+    return "\n".join(lines)
+
+
+def make_connector(concurrency, limit_per_host=LIMIT_PER_HOST):
+    # جلسة وحدة مشتركة: keep-alive يعيد استعمال الاتصالات، وكاش DNS يوفر lookup لكل طلب
+    return aiohttp.TCPConnector(
+        limit=concurrency,
+        limit_per_host=limit_per_host or concurrency,
+        ttl_dns_cache=DNS_CACHE_SECONDS,
+        keepalive_timeout=KEEPALIVE_SECONDS,
+        enable_cleanup_closed=True,
+    )
+
+
+LOAD_HEADERS = {"User-Agent": USER_AGENTS[0], "Accept": "text/html,application/json;q=0.9,*/*;q=0.8"}
+
+
+async def timed_request(session, base_url, path, stats, ttfb=MEASURE_TTFB, checksum=MEASURE_CHECKSUM,
+                        label=None):
+    url = base_url.rstrip("/") + (path if path.startswith("/") else "/" + path)
+    label = label or path
+    start = time.perf_counter()
+    try:
+        status, size, first_byte, crc = await fetch(session, url, LOAD_HEADERS, checksum)
+        stats.record(label, time.perf_counter() - start, status=status, size=size,
+                     ttfb=first_byte if ttfb else None, crc=crc)
+        logger.debug("REQ GET %s -> %s", label, status,
+                     extra={'path': label, 'status': status, 'size': size})
+    except Exception as e:
+        stats.record(label, time.perf_counter() - start, error=type(e).__name__)
+        logger.debug("ERR GET %s -> %r", label, e, extra={'path': label})
+
+
+def build_routes(targets):
+    """[(base_url, endpoints, share)] -> [(base_url, path, label, weight)].
+
+    Each target gets `share` of the traffic, split over its endpoints by
+    their weights. With several targets the stats label carries the host.
+    """
+    routes = []
+    for base_url, endpoints, share in targets:
+        total = sum(weight for _, weight in endpoints) or 1.0
+        host = urlsplit(base_url).netloc
+        for path, weight in endpoints:
+            label = path if len(targets) == 1 else host + path
+            routes.append((base_url, path, label, share * weight / total))
+    return routes
+
+
+async def run_load(base_url=None, rps=TARGET_RPS, concurrency=CONCURRENCY, phases=None,
+                   endpoints=None, seed=None, ttfb=MEASURE_TTFB, checksum=MEASURE_CHECKSUM,
+                   run_dir=None, targets=None, results_name="requests.csv"):
+    """Open-loop load: Poisson arrivals whose rate follows `phases`.
+
+    Arrivals for a time-varying rate are drawn by thinning a Poisson process
+    at the peak rate, so the schedule never waits on responses; an arrival
+    that finds `concurrency` requests in flight is counted as dropped.
+    `targets` ([(base_url, endpoints, share)]) spreads the same arrival
+    stream over several sites instead of `base_url` alone.
+    """
+    phases = phases or build_phases(rps, RAMP_UP_SECONDS, STEADY_SECONDS, RAMP_DOWN_SECONDS)
+    targets = targets or [(base_url, endpoints or parse_weights(ENDPOINT_WEIGHTS), 1.0)]
+    routes = build_routes(targets)
+    cumulative = []
+    total_weight = 0.0
+    for _, _, _, weight in routes:
+        total_weight += weight
+        cumulative.append(total_weight)
+    peak = max(max(start, end) for _, _, start, end in phases)
+    rng = random.Random(seed)
+    stats = LoadStats()
+    if run_dir:
+        stats.results = ResultBuffer(os.path.join(run_dir, results_name))
+    in_flight = set()
+
+    logger.info("Load run starting: %s at up to %.1f req/s, concurrency %d",
+                ", ".join(target[0] for target in targets), peak, concurrency)
+    session = get_session(concurrency)
+    loop = asyncio.get_running_loop()
+    stats.started = loop.time()
+    stats.clock_start = time.perf_counter()
+    next_at = 0.0
+    while True:
+        next_at += rng.expovariate(peak)
+        current = rate_at(phases, next_at)
+        if current is None:
+            break
+        phase, rate = current
+        if rng.random() * peak > rate:
+            continue
+        delay = stats.started + next_at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        stats.scheduled += 1
+        stats.per_phase[phase] += 1
+        if len(in_flight) >= concurrency:
+            stats.dropped += 1
+            continue
+        target_url, path, label, _ = routes[bisect.bisect_right(cumulative, rng.random() * total_weight)]
+        task = loop.create_task(timed_request(session, target_url, path, stats, ttfb, checksum, label))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.gather(*in_flight, return_exceptions=True)
+    stats.elapsed = loop.time() - stats.started
+    if stats.results is not None:
+        stats.results.flush()
+    logger.info("Load run complete: %d requests, %d dropped", stats.overall.count, stats.dropped)
+    return stats
+
+
+# ---------- عدة عمليات ----------
+
+def plan_from_args(args):
+    """The shared plan every worker gets: targets, endpoints, rates and phases."""
+    if args.plan:
+        with open(args.plan) as f:
+            plan = json.load(f)
+    else:
+        plan = {}
+    endpoints = plan.get("endpoints", args.endpoints)
+    targets = plan.get("targets") or [{"base_url": url} for url in (args.target or [args.base_url])]
+    return {
+        # بدون rps لكل هدف، المعدل الكلي يتقسم بالتساوي
+        "targets": [
+            {
+                "base_url": target["base_url"],
+                "endpoints": target.get("endpoints", endpoints),
+                "rps": target.get("rps", plan.get("rps", args.rps) / len(targets)),
+            }
+            for target in targets
+        ],
+        "concurrency": plan.get("concurrency", args.concurrency),
+        "ramp_up": plan.get("ramp_up", args.ramp_up),
+        "duration": plan.get("duration", args.duration),
+        "ramp_down": plan.get("ramp_down", args.ramp_down),
+        "seed": plan.get("seed", args.seed),
+        "ttfb": plan.get("ttfb", args.ttfb),
+        "checksum": plan.get("checksum", args.checksum),
+    }
+
+
+async def run_plan(plan, workers=1, index=0, run_dir=None, start_at=None):
+    """Runs this process's 1/`workers` slice of the plan."""
+    total_rps = sum(target["rps"] for target in plan["targets"])
+    targets = [
+        (target["base_url"], parse_weights(target["endpoints"]), target["rps"] / total_rps)
+        for target in plan["targets"]
+    ]
+    if start_at is not None:
+        # كل العمليات تبدأ بنفس اللحظة حتى تتطابق المراحل
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+    seed = plan["seed"]
+    try:
+        return await run_load(
+            targets=targets,
+            concurrency=max(1, plan["concurrency"] // workers),
+            phases=build_phases(total_rps / workers, plan["ramp_up"], plan["duration"], plan["ramp_down"]),
+            seed=None if seed is None else seed + index,
+            ttfb=plan["ttfb"],
+            checksum=plan["checksum"],
+            run_dir=run_dir,
+            results_name="requests.csv" if workers == 1 else f"requests-{index}.csv",
+        )
+    finally:
+        await close_session()
+
+
+def _load_worker(plan, workers, index, run_dir, start_at):
+    stats = asyncio.run(run_plan(plan, workers, index, run_dir, start_at))
+    # ResultBuffer انكتب للملف؛ ما نرجعه للمنسق
+    stats.results = None
+    return stats
+
+
+def run_distributed(plan, workers, run_dir=None):
+    """Forks `workers` processes on the same plan and merges their stats."""
+    start_at = time.time() + 1.0 + 0.05 * workers
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(_load_worker, plan, workers, index, run_dir, start_at)
+            for index in range(workers)
+        ]
+        merged = LoadStats()
+        for future in futures:
+            merged.merge(future.result())
+    return merged
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Website traffic simulator and load generator")
+    parser.add_argument("--base-url", default=BASE_URL)
+    sub = parser.add_subparsers(dest="command")
+
+    schedule = sub.add_parser("schedule", help="a few requests every interval (default)")
+    schedule.add_argument("--interval-minutes", type=float, default=RUN_INTERVAL_MINUTES)
+
+    load = sub.add_parser("load", help="open-loop load test with a summary report")
+    load.add_argument("--workers", type=int, default=WORKERS,
+                      help="processes sharing the load, each with its own loop and pool")
+    load.add_argument("--target", action="append",
+                      help="base URL to load; repeat for several sites (default --base-url)")
+    load.add_argument("--plan", help="JSON plan with targets, per-target rps/endpoints and phases")
+    load.add_argument("--rps", type=float, default=TARGET_RPS)
+    load.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    load.add_argument("--ramp-up", type=float, default=RAMP_UP_SECONDS)
+    load.add_argument("--duration", type=float, default=STEADY_SECONDS, help="steady phase seconds")
+    load.add_argument("--ramp-down", type=float, default=RAMP_DOWN_SECONDS)
+    load.add_argument("--endpoints", default=ENDPOINT_WEIGHTS,
+                      help="weighted paths, e.g. '/=5,/api/health=1'")
+    load.add_argument("--seed", type=int)
+    load.add_argument("--no-ttfb", dest="ttfb", action="store_false", default=MEASURE_TTFB)
+    load.add_argument("--checksum", action="store_true", default=MEASURE_CHECKSUM,
+                      help="CRC32 every body and report distinct bodies per endpoint")
+    load.add_argument("--out", help=f"run directory (default: a new one under {RESULTS_DIR}/)")
+    load.add_argument("--no-export", dest="export", action="store_false",
+                      help="only print the summary, write no files")
+
+    compare = sub.add_parser("compare", help="diff two load runs and flag latency regressions")
+    compare.add_argument("base", help="run directory or summary.json")
+    compare.add_argument("new", help="run directory or summary.json")
+    compare.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                         help="percent a latency percentile may grow")
+    compare.add_argument("--min-ms", type=float, default=REGRESSION_MIN_MS,
+                         help="ignore changes smaller than this many ms")
+    return parser.parse_args(argv)
+
+
+def check_base_url(base_url):
+    if base_url.startswith("http://") or base_url.startswith("https://"):
+        return True
+    logger.error("BASE_URL must start with http:// or https://. Exiting.")
+    print("ERROR: عدّل BASE_URL في traffic_simulator.py إلى رابط موقعك وابدأ من جديد.")
+    return False
+
+
+def load_main(args):
+    plan = plan_from_args(args)
+    if not all(check_base_url(target["base_url"]) for target in plan["targets"]):
+        return 1
+    run_dir = None
+    if args.export:
+        run_dir = args.out or new_run_dir()
+        os.makedirs(run_dir, exist_ok=True)
+    if args.workers > 1:
+        stats = run_distributed(plan, args.workers, run_dir)
+    else:
+        stats = asyncio.run(run_plan(plan, run_dir=run_dir))
+    print(stats.summary())
+    if run_dir:
+        write_summary(run_dir, stats, dict(plan, workers=args.workers))
+        print(f"results: {run_dir}")
+    return 0
+
+
+def compare_main(args):
+    rows = compare_runs(load_summary(args.base), load_summary(args.new), args.threshold, args.min_ms)
+    print(format_comparison(rows))
+    regressions = sum(1 for row in rows if row[5] == 'REGRESSION')
+    if regressions:
+        print(f"{regressions} regression(s)")
+    return 1 if regressions else 0
+
 
-async def main():
-    logging.info("Traffic simulator starting")
+async def main(interval_minutes=RUN_INTERVAL_MINUTES):
+    logger.info("Traffic simulator starting")
     # اختبار بسيط قبل الجدولة للتأكد من أن BASE_URL متاحة
-    if not (BASE_URL.startswith("http://") or BASE_URL.startswith("https://")):
-        logging.error("BASE_URL must start with http:// or https://. Exiting.")
-        print("ERROR: عدّل BASE_URL في traffic_simulator.py إلى رابط موقعك وابدأ من جديد.")
+    if not check_base_url(BASE_URL):
         return
 
     # محاولة اتصال بسيط الآن
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(BASE_URL, timeout=REQUEST_TIMEOUT) as resp:
-                logging.info(f"Initial GET {BASE_URL} -> {resp.status}")
+        status, _, _, _ = await fetch(get_session(), BASE_URL)
+        logger.info("Initial GET %s -> %s", BASE_URL, status)
     except Exception as e:
-        logging.warning(f"Initial GET failed: {e}")
+        logger.warning("Initial GET failed: %s", e)
 
-    schedule_every_30_minutes()
+    schedule_runs(interval_minutes)
 
     # نبقي البوت شغالاً في حلقة لا نهائية
     try:
         while True:
             await asyncio.sleep(3600)
     except (KeyboardInterrupt, SystemExit):
-        logging.info("Traffic simulator stopping")
+        logger.info("Traffic simulator stopping")
+    finally:
+        await close_session()
 
 if __name__ == "__main__":
+    args = parse_args()
+    BASE_URL = args.base_url
     try:
-        asyncio.run(main())
+        if args.command == "load":
+            sys.exit(load_main(args))
+        if args.command == "compare":
+            sys.exit(compare_main(args))
+        asyncio.run(main(getattr(args, "interval_minutes", RUN_INTERVAL_MINUTES)))
     except Exception as ex:
-        logging.exception("Unhandled exception, exiting")
+        logger.exception("Unhandled exception, exiting")
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# حد أعلى للتحديثات المعلقة بالذاكرة (منتظرة دورها أو شغالة)
+MAX_PENDING_UPDATES = 10000
+
+
+def ordering_key(update):
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently while keeping each user's updates in order.
+
+    PTB takes its own semaphore before do_process_update(), so it is sized
+    to MAX_PENDING_UPDATES and the real worker limit is applied only after
+    the per-user lock. That way a user with a backlog waits on its own lock
+    without holding a worker slot other users need.
+    """
+
+    def __init__(self, workers):
+        super().__init__(max_concurrent_updates=MAX_PENDING_UPDATES)
+        self.workers = workers
+        self._workers = asyncio.BoundedSemaphore(workers)
+        self._locks = {}
+        self.pending = 0
+        self.active = 0
+        # time.monotonic() لآخر تحديث انتهت معالجته، للـ health checks
+        self.last_processed = None
+
+    async def do_process_update(self, update, coroutine):
+        key = ordering_key(update)
+        self.pending += 1
+        try:
+            if key is None:
+                await self._run(coroutine)
+                return
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [asyncio.Lock(), 0]
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    await self._run(coroutine)
+            finally:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+        finally:
+            self.pending -= 1
+
+    async def _run(self, coroutine):
+        async with self._workers:
+            self.active += 1
+            try:
+                await coroutine
+                self.last_processed = time.monotonic()
+            finally:
+                self.active -= 1
+
+    @property
+    def waiting(self):
+        return self.pending - self.active
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
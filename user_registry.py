@@ -0,0 +1,206 @@
+import heapq
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import islice
+
+# علامة المستخدم المحذوف داخل المصفوفة لحد الدمج التالي
+_GONE = -1
+BUCKET_SECONDS = 3600
+
+
+class UserRegistry:
+    """Last-seen time (epoch seconds) per user id, ~16 bytes per user.
+
+    Ids sit sorted in one array('q') and their last-seen times in a
+    parallel one; lookups bisect. Touching a known user overwrites its slot
+    in place, so only brand new users go into a small overlay dict, merged
+    into the arrays once it outgrows 1/16 of them. Deleted users are marked
+    in place and dropped by the same merge.
+
+    Users per last-seen hour are counted as they move, so count_since(hours)
+    sums at most `hours` buckets instead of scanning everyone. Counts are
+    exact to the hour: a 24h window covers the current hour and the 23
+    before it.
+
+    seen_since() lists users by the same hour buckets. Their members are
+    indexed on first use only: each move appends the id to its new hour,
+    and the stale copy left behind is skipped on read (and dropped when the
+    index is rebuilt), so a query touches the active users, not everyone.
+    """
+
+    MIN_OVERLAY = 1024
+
+    def __init__(self, pairs=()):
+        self.ids = array('q')
+        self.seen = array('q')
+        self.hours = {}
+        self._overlay = {}
+        self._gone = 0
+        # hour -> array('q') من المعرفات، يتبنى بأول seen_since()
+        self._members = None
+        self._member_entries = 0
+        append_id, append_seen = self.ids.append, self.seen.append
+        for user_id, epoch in pairs:
+            append_id(user_id)
+            append_seen(int(epoch))
+        ids = self.ids
+        if any(a >= b for a, b in zip(ids, islice(ids, 1, None))):
+            # مصدر غير مرتب (مثل users.json): نرتب مرة وحدة ونشيل المكرر
+            pairs = dict(zip(ids, self.seen))
+            self.ids = array('q', sorted(pairs))
+            self.seen = array('q', map(pairs.__getitem__, self.ids))
+        self.hours = dict(Counter(epoch // BUCKET_SECONDS for epoch in self.seen))
+
+    def _count(self, epoch, delta):
+        bucket = epoch // BUCKET_SECONDS
+        left = self.hours.get(bucket, 0) + delta
+        if left:
+            self.hours[bucket] = left
+        else:
+            del self.hours[bucket]
+
+    def _slot(self, user_id):
+        ids = self.ids
+        i = bisect_left(ids, user_id)
+        if i < len(ids) and ids[i] == user_id:
+            return i
+        return None
+
+    def get(self, user_id, default=None):
+        epoch = self._overlay.get(user_id)
+        if epoch is not None:
+            return epoch
+        i = self._slot(user_id)
+        if i is None or self.seen[i] == _GONE:
+            return default
+        return self.seen[i]
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __len__(self):
+        return len(self.ids) - self._gone + len(self._overlay)
+
+    def set(self, user_id, epoch):
+        """Records `epoch` for the user; returns the previous one or None."""
+        epoch = int(epoch)
+        old = self._overlay.get(user_id)
+        if old is not None:
+            self._overlay[user_id] = epoch
+        else:
+            i = self._slot(user_id)
+            if i is None:
+                self._overlay[user_id] = epoch
+                if len(self._overlay) > max(self.MIN_OVERLAY, len(self.ids) >> 4):
+                    self._compact()
+            else:
+                old = self.seen[i]
+                if old == _GONE:
+                    old = None
+                    self._gone -= 1
+                self.seen[i] = epoch
+        if old != epoch:
+            if old is not None:
+                self._count(old, -1)
+            self._count(epoch, 1)
+            if self._members is not None and (old is None or old // BUCKET_SECONDS != epoch // BUCKET_SECONDS):
+                self._add_member(user_id, epoch)
+        return old
+
+    def pop(self, user_id):
+        old = self._overlay.pop(user_id, None)
+        if old is None:
+            i = self._slot(user_id)
+            if i is None or self.seen[i] == _GONE:
+                return None
+            old = self.seen[i]
+            self.seen[i] = _GONE
+            self._gone += 1
+            if self._gone > max(self.MIN_OVERLAY, len(self.ids) >> 4):
+                self._compact()
+        self._count(old, -1)
+        return old
+
+    def _compact(self):
+        added = sorted(self._overlay.items())
+        self._overlay = {}
+        if not self._gone and (not self.ids or not added or added[0][0] > self.ids[-1]):
+            # الحالة الشائعة: معرفات تيليجرام الجديدة أكبر من القديمة، فبس نضيف بالآخر
+            self.ids.extend(user_id for user_id, _ in added)
+            self.seen.extend(epoch for _, epoch in added)
+            return
+        ids, seen = array('q'), array('q')
+        for user_id, epoch in heapq.merge(self._live(), added):
+            ids.append(user_id)
+            seen.append(epoch)
+        self.ids, self.seen, self._gone = ids, seen, 0
+
+    def _live(self):
+        return ((user_id, epoch) for user_id, epoch in zip(self.ids, self.seen) if epoch != _GONE)
+
+    def items(self):
+        """(user_id, epoch) pairs in id order."""
+        return heapq.merge(self._live(), sorted(self._overlay.items()))
+
+    def __iter__(self):
+        # بعد الدمج المصفوفة نفسها هي القائمة، فالمرور عليها بسرعة C
+        if self._overlay or self._gone:
+            self._compact()
+        return iter(self.ids)
+
+    def snapshot(self):
+        # نسخة ثابتة تنقرأ من thread ثاني بينما الأصل يتغير
+        if self._overlay or self._gone:
+            self._compact()
+        return self.ids[:], self.seen[:]
+
+    def update_from(self, older):
+        """Takes over `older`'s users, keeping the ones here that are newer."""
+        recent = list(self.items())
+        self.ids, self.seen, self.hours = older.ids, older.seen, older.hours
+        self._overlay, self._gone = older._overlay, older._gone
+        self._members, self._member_entries = None, 0
+        for user_id, epoch in recent:
+            if epoch > self.get(user_id, -1):
+                self.set(user_id, epoch)
+
+    def _add_member(self, user_id, epoch):
+        bucket = self._members.get(epoch // BUCKET_SECONDS)
+        if bucket is None:
+            bucket = self._members[epoch // BUCKET_SECONDS] = array('q')
+        bucket.append(user_id)
+        self._member_entries += 1
+
+    def _index_members(self):
+        self._members, self._member_entries = {}, 0
+        for user_id, epoch in self.items():
+            self._add_member(user_id, epoch)
+
+    def seen_since(self, epoch):
+        """Ids of users last seen at or after `epoch`, in no particular order."""
+        # النسخ القديمة تتراكم مع الحركة؛ إذا صارت أكثر من النص نعيد البناء
+        if self._members is None or self._member_entries > 2 * len(self) + self.MIN_OVERLAY:
+            self._index_members()
+        first = int(epoch) // BUCKET_SECONDS
+        # set: مستخدم رجع لساعة كان بيها ينضاف لها مرة ثانية
+        result = set()
+        for bucket, members in self._members.items():
+            if bucket < first:
+                continue
+            for user_id in members:
+                seen = self.get(user_id)
+                # انتقل لساعة ثانية أو انحذف
+                if seen is not None and seen // BUCKET_SECONDS == bucket and seen >= epoch:
+                    result.add(user_id)
+        return list(result)
+
+    def count_since(self, hours, now=None):
+        current = int(now or time.time()) // BUCKET_SECONDS
+        counts = self.hours
+        first = current - hours + 1
+        # /active بعدد ساعات كبير: نمر على الساعات الموجودة بدل ملايين المفاتيح الفارغة
+        if hours > len(counts):
+            return sum(count for bucket, count in counts.items() if first <= bucket <= current)
+        return sum(counts.get(b, 0) for b in range(first, current + 1))
@@ -0,0 +1,143 @@
+import asyncio
+import hmac
+import logging
+import os
+import signal
+
+from aiohttp import web
+
+import cluster
+import metrics
+from health import monitor
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+updates_received = metrics.Counter(
+    'bot_webhook_updates_total', "Webhook requests by outcome", ['outcome']
+)
+
+
+class WebhookConfig:
+    def __init__(self, url, path='/telegram', secret=None, port=8000, queue_size=1000,
+                 drop_pending_updates=True, host='0.0.0.0', register=True):
+        self.url = url
+        self.path = path
+        self.secret = secret
+        self.port = port
+        self.queue_size = queue_size
+        self.drop_pending_updates = drop_pending_updates
+        self.host = host
+        # workers خلف ingress.py ما يسجلون الـ webhook؛ الـ ingress يسجل عنوانه هو
+        self.register = register
+
+    @classmethod
+    def from_env(cls):
+        path = os.environ.get("WEBHOOK_PATH", "/telegram")
+        return cls(
+            url=os.environ.get("WEBHOOK_URL", "").rstrip('/') + path,
+            path=path,
+            secret=os.environ.get("WEBHOOK_SECRET") or None,
+            port=int(os.environ.get("PORT", 8000)),
+            queue_size=int(os.environ.get("WEBHOOK_QUEUE_SIZE", "1000")),
+            drop_pending_updates=os.environ.get("DROP_PENDING_UPDATES", "1") != "0",
+            host=os.environ.get("WEBHOOK_HOST", "0.0.0.0"),
+            register=os.environ.get("WEBHOOK_REGISTER", "1") != "0",
+        )
+
+
+def build_web_app(application, config):
+    # هنا وليس بأعلى الملف: ingress.py يستخدم WebhookConfig بدون تحميل مكتبة telegram
+    from telegram import Update
+
+    async def telegram_update(request):
+        if config.secret and not hmac.compare_digest(
+                request.headers.get(SECRET_HEADER, ''), config.secret):
+            updates_received.inc('forbidden')
+            return web.Response(status=403)
+        # الطابور ممتلئ: نرجع 503 وتيليجرام يعيد المحاولة لاحقاً. مع
+        # PerUserUpdateProcessor الطابور يفضى فوراً والتراكم الحقيقي بـ
+        # processor.pending، فنعد نفس العمق اللي يشوفه /readyz
+        if monitor.queue_depth() >= config.queue_size:
+            updates_received.inc('rejected')
+            return web.Response(status=503)
+        try:
+            data = await request.json()
+        except ValueError:
+            updates_received.inc('bad_request')
+            return web.Response(status=400)
+        application.update_queue.put_nowait(Update.de_json(data, application.bot))
+        updates_received.inc('accepted')
+        monitor.fetched()
+        return web.Response()
+
+    async def cluster_change(request):
+        if not hmac.compare_digest(request.headers.get(cluster.CONTROL_HEADER, ''), cluster.CONTROL_SECRET):
+            return web.Response(status=403)
+        try:
+            message = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        return web.Response(status=200 if cluster.apply(message) else 400)
+
+    async def liveness(request):
+        report = monitor.report()
+        return web.json_response(report, status=200 if report['live'] else 503)
+
+    async def readiness(request):
+        report = monitor.report()
+        return web.json_response(report, status=200 if report['ready'] else 503)
+
+    async def metrics_endpoint(request):
+        return web.Response(text=metrics.render(), content_type='text/plain')
+
+    app = web.Application()
+    app.router.add_post(config.path, telegram_update)
+    app.router.add_get('/', liveness)
+    app.router.add_get('/livez', liveness)
+    app.router.add_get('/readyz', readiness)
+    app.router.add_get('/metrics', metrics_endpoint)
+    if cluster.enabled and cluster.CONTROL_SECRET:
+        app.router.add_post(cluster.CONTROL_PATH, cluster_change)
+    return app
+
+
+async def run_webhook(application, config):
+    """Same start/stop sequence as Application.run_polling, with our aiohttp server."""
+    from telegram import Update
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+
+    runner = web.AppRunner(build_web_app(application, config), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, config.host, config.port).start()
+    if config.register:
+        await application.bot.set_webhook(
+            config.url,
+            secret_token=config.secret,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=config.drop_pending_updates,
+        )
+    logger.info("Webhook server listening on port %s", config.port)
+
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await cluster.close()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)